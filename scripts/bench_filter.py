@@ -0,0 +1,77 @@
+"""过滤插件的单条消息开销：逐条 utils.match 与编译后的 MultiMatcher 对比。
+
+用法（在仓库根目录）：
+
+    python scripts/bench_filter.py
+
+关键词全部不命中，即过滤时最坏的情况。调整 utils.AUTOMATON_MIN_KEYWORDS
+时用它确认 `in` 循环与 Aho-Corasick 的分界点。
+"""
+
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tgcf.utils import AUTOMATON_MIN_KEYWORDS, MultiMatcher, match  # noqa: E402
+
+SIZES = [10, 100, 150, 300, 1000, 2000, 5000]
+SEED = 1
+
+
+def words(rng: random.Random, n: int, lo: int, hi: int):
+    letters = string.ascii_lowercase[:8]
+    return ["".join(rng.choices(letters, k=rng.randint(lo, hi))) for _ in range(n)]
+
+
+def per_call(func, budget: float = 0.3) -> float:
+    """重复调用 func 约 budget 秒，返回单次耗时（微秒）。"""
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / runs * 1e6
+
+
+def fmt(us: float) -> str:
+    return f"{us / 1000:.1f}ms" if us >= 1000 else f"{us:.0f}us"
+
+
+def main() -> None:
+    rng = random.Random(SEED)
+    texts = {
+        "short": " ".join(words(rng, 40, 3, 9)),
+        "long": " ".join(words(rng, 600, 3, 9)),
+    }
+    print(f"AUTOMATON_MIN_KEYWORDS = {AUTOMATON_MIN_KEYWORDS}")
+    print(
+        f"{'keywords':>8}  {'text':>7}  {'plain old -> new':>22}  {'regex old -> new':>22}"
+    )
+    for n in SIZES:
+        # 后缀保证不命中
+        keywords = [w + "zq" for w in words(rng, n, 4, 10)]
+        patterns = [w + r"\d+zq" for w in words(rng, n, 4, 10)]
+        plain = MultiMatcher(keywords, False)
+        regex = MultiMatcher(patterns, True)
+        for text in texts.values():
+            assert plain.search(text) == any(match(k, text, False) for k in keywords)
+            assert regex.search(text) == any(match(p, text, True) for p in patterns)
+            plain_old = per_call(lambda: any(match(k, text, False) for k in keywords))
+            plain_new = per_call(lambda: plain.search(text))
+            regex_old = per_call(lambda: any(match(p, text, True) for p in patterns))
+            regex_new = per_call(lambda: regex.search(text))
+            print(
+                f"{n:>8}  {len(text):>5}ch  "
+                f"{fmt(plain_old):>9} -> {fmt(plain_new):>8}  "
+                f"{fmt(regex_old):>9} -> {fmt(regex_new):>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""替换插件的单条消息开销：逐条 utils.replace 与编译后的 ReplaceEngine 对比。
+
+用法（在仓库根目录）：
+
+    python scripts/bench_replace.py
+
+规则是互不重叠的单词 → 大写，文本里约十分之一的单词会被替换。
+regex 一列用同样的规则开启正则模式（规则不含元字符，会走纯文本合并）。
+调整 utils.AUTOMATON_MIN_KEYWORDS 时用它确认两种合并方式的分界点。
+"""
+
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tgcf.utils import AUTOMATON_MIN_KEYWORDS, ReplaceEngine, replace  # noqa: E402
+
+SIZES = [10, 100, 150, 300, 1000]
+SEED = 2
+
+
+def words(rng: random.Random, n: int, lo: int, hi: int):
+    letters = string.ascii_lowercase
+    return ["".join(rng.choices(letters, k=rng.randint(lo, hi))) for _ in range(n)]
+
+
+def per_call(func, budget: float = 0.3) -> float:
+    """重复调用 func 约 budget 秒，返回单次耗时（微秒）。"""
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / runs * 1e6
+
+
+def fmt(us: float) -> str:
+    return f"{us / 1000:.1f}ms" if us >= 1000 else f"{us:.0f}us"
+
+
+def sequential(rules, text: str, regex: bool) -> str:
+    """插件改用 ReplaceEngine 之前的做法：每条规则调用一次 replace。"""
+    for original, new in rules.items():
+        text = replace(original, new, text, regex)
+    return text
+
+
+def make_text(rng: random.Random, vocabulary, n_words: int) -> str:
+    picked = [
+        rng.choice(vocabulary) if rng.random() < 0.1 else w
+        for w in words(rng, n_words, 3, 9)
+    ]
+    return " ".join(picked)
+
+
+def main() -> None:
+    rng = random.Random(SEED)
+    print(f"AUTOMATON_MIN_KEYWORDS = {AUTOMATON_MIN_KEYWORDS}")
+    print(
+        f"{'rules':>6}  {'text':>7}  {'plain old -> new':>22}  {'regex old -> new':>22}"
+    )
+    for n in SIZES:
+        vocabulary = sorted(set(w + "x" for w in words(rng, n, 4, 9)))
+        rules = {w: w.upper() for w in vocabulary}
+        plain = ReplaceEngine(rules, False)
+        regex = ReplaceEngine(rules, True)
+        for n_words in (80, 700):
+            text = make_text(rng, vocabulary, n_words)
+            assert plain.apply(text) == sequential(rules, text, False)
+            assert regex.apply(text) == sequential(rules, text, True)
+            plain_old = per_call(lambda: sequential(rules, text, False))
+            plain_new = per_call(lambda: plain.apply(text))
+            regex_old = per_call(lambda: sequential(rules, text, True))
+            regex_new = per_call(lambda: regex.apply(text))
+            print(
+                f"{len(rules):>6}  {len(text):>5}ch  "
+                f"{fmt(plain_old):>9} -> {fmt(plain_new):>8}  "
+                f"{fmt(regex_old):>9} -> {fmt(regex_new):>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
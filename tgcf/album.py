@@ -0,0 +1,166 @@
+"""媒体组（相册）组装器。
+
+live 模式下同一相册的各条消息是分别到达的，这里把它们按
+(chat_id, grouped_id) 收集起来，满 10 条立即发送，否则等到
+"最后一条之后不会再来" 时发送。等待时间根据观测到的相册内
+到达间隔自适应调整，总缓存量有上限，发送后清理所有状态。
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from telethon.tl.custom.message import Message
+
+# Telegram 相册最多 10 项
+ALBUM_MAX_ITEMS = 10
+# 等待时间 = 平均到达间隔 × GAP_FACTOR，再限制在 [min_wait, max_wait]
+GAP_FACTOR = 4.0
+GAP_SMOOTHING = 0.2
+# 发送后的相册在 max_wait × LATE_WINDOW 秒内记住，用来发现晚到被拆开的项
+LATE_WINDOW = 10
+RECENT_ALBUMS = 256
+
+AlbumKey = Tuple[int, int]
+FlushCallback = Callable[[int, List[Message]], Awaitable[None]]
+
+
+class _Album:
+    __slots__ = ("chat_id", "grouped_id", "messages", "size", "last_arrival", "timer")
+
+    def __init__(self, chat_id: int, grouped_id: int) -> None:
+        self.chat_id = chat_id
+        self.grouped_id = grouped_id
+        self.messages: List[Message] = []
+        self.size = 0
+        self.last_arrival = 0.0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+def _message_size(message: Message) -> int:
+    file = getattr(message, "file", None)
+    return (getattr(file, "size", None) or 0) if file else 0
+
+
+class AlbumAssembler:
+    """按相册收集消息，组完整或超时后回调 on_flush(chat_id, messages)。"""
+
+    def __init__(
+        self,
+        on_flush: FlushCallback,
+        min_wait: float,
+        max_wait: float,
+        max_messages: int,
+        max_bytes: int,
+    ) -> None:
+        self.on_flush = on_flush
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.albums: Dict[AlbumKey, _Album] = {}
+        self.by_msg: Dict[Tuple[int, int], int] = {}
+        self.buffered_messages = 0
+        self.buffered_bytes = 0
+        # 初始估计：假设相册内消息间隔为 max_wait 对应的值
+        self.avg_gap = max_wait / GAP_FACTOR
+        # 最近发送的相册 → 最后一项到达的时间
+        self.recent: "OrderedDict[AlbumKey, float]" = OrderedDict()
+        self.split = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def wait(self) -> float:
+        return min(self.max_wait, max(self.min_wait, self.avg_gap * GAP_FACTOR))
+
+    def add(self, chat_id: int, message: Message) -> None:
+        """把一条相册消息加入缓存，并按需立即或延迟发送。"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        key = (chat_id, message.grouped_id)
+        album = self.albums.get(key)
+        if album is None:
+            album = self.albums[key] = _Album(chat_id, message.grouped_id)
+            self._check_late(key, now)
+        elif album.messages:
+            gap = now - album.last_arrival
+            self.avg_gap += GAP_SMOOTHING * (gap - self.avg_gap)
+
+        size = _message_size(message)
+        album.messages.append(message)
+        album.size += size
+        album.last_arrival = now
+        self.by_msg[(chat_id, message.id)] = message.grouped_id
+        self.buffered_messages += 1
+        self.buffered_bytes += size
+
+        if len(album.messages) >= ALBUM_MAX_ITEMS:
+            self.flush(key)
+        else:
+            if album.timer is not None:
+                album.timer.cancel()
+            album.timer = loop.call_later(self.wait, self.flush, key)
+
+        # 超出缓存上限时，从最早的相册开始提前发送
+        while self.albums and (
+            self.buffered_messages > self.max_messages
+            or self.buffered_bytes > self.max_bytes
+        ):
+            oldest = next(iter(self.albums))
+            logging.warning(f"⚠️ 相册缓存超限，提前发送 {oldest}")
+            self.flush(oldest)
+
+    def _check_late(self, key: AlbumKey, now: float) -> None:
+        """该相册刚发送过又来了新项：说明等待时间太短，按这次的间隔调大。"""
+        while self.recent and (
+            len(self.recent) > RECENT_ALBUMS
+            or next(iter(self.recent.values())) < now - self.max_wait * LATE_WINDOW
+        ):
+            self.recent.popitem(last=False)
+        last_arrival = self.recent.pop(key, None)
+        if last_arrival is None:
+            return
+        gap = now - last_arrival
+        # 只靠平滑学不到比当前等待更长的间隔，直接抬到这次的间隔
+        self.avg_gap = max(self.avg_gap, gap)
+        self.split += 1
+        logging.warning(f"⚠️ 相册 {key} 被拆分：晚到 {gap:.2f}s，等待时间调整为 {self.wait:.2f}s")
+
+    def flush(self, key: AlbumKey) -> None:
+        """移除相册的全部状态并异步发送。"""
+        album = self.albums.pop(key, None)
+        if album is None:
+            return
+        if album.timer is not None:
+            album.timer.cancel()
+        self.recent[key] = album.last_arrival
+        self.recent.move_to_end(key)
+        for message in album.messages:
+            self.by_msg.pop((album.chat_id, message.id), None)
+        self.buffered_messages -= len(album.messages)
+        self.buffered_bytes -= album.size
+
+        messages = sorted(album.messages, key=lambda m: m.id)
+        task = asyncio.ensure_future(
+            self._run(album.chat_id, album.grouped_id, messages)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(
+        self, chat_id: int, grouped_id: int, messages: List[Message]
+    ) -> None:
+        try:
+            await self.on_flush(chat_id, messages)
+        except Exception as e:
+            logging.exception(
+                f"Failed to send grouped messages for grouped_id={grouped_id}: {e}"
+            )
+
+    def group_of(self, chat_id: int, msg_id: int) -> Optional[List[int]]:
+        """返回仍在缓存中的同组消息 ID。"""
+        grouped_id = self.by_msg.get((chat_id, msg_id))
+        if grouped_id is None:
+            return None
+        return [m.id for m in self.albums[(chat_id, grouped_id)].messages]
@@ -15,6 +15,7 @@ from tgcf.bot.utils import (
 )
 from tgcf.config import CONFIG, write_config
 from tgcf.plugin_models import Style
+from tgcf.ratelimit import get_limiter
 
 
 @admin_protect
@@ -121,6 +122,16 @@ async def style_command_handler(event):
         raise events.StopPropagation
 
 
+@admin_protect
+async def limits_command_handler(event):
+    """Handle the /limits command."""
+    try:
+        snapshot = get_limiter().snapshot()
+        await event.respond(f"```\n{yaml.safe_dump(snapshot, sort_keys=False)}\n```")
+    finally:
+        raise events.StopPropagation
+
+
 async def start_command_handler(event):
     """Handle the /start command."""
     await event.respond(CONFIG.bot_messages.start)
@@ -140,6 +151,7 @@ def get_events():
         "remove": (remove_command_handler, events.NewMessage(pattern=f"{_}remove")),
         "style": (style_command_handler, events.NewMessage(pattern=f"{_}style")),
         "help": (help_command_handler, events.NewMessage(pattern=f"{_}help")),
+        "limits": (limits_command_handler, events.NewMessage(pattern=f"{_}limits")),
     }
 
     return command_events
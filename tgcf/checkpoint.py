@@ -0,0 +1,164 @@
+"""past 模式的 offset 检查点日志。
+
+每发送完一批消息只向日志文件追加一行 JSON（连接 → offset），
+而不是把整个配置重新序列化写回 tgcf.config.json；Mongo 后端也同样
+写这个本地日志，因此崩溃后无论哪种后端都能从上次的位置继续。
+
+每行写入后立即 flush 到操作系统（进程崩溃不会丢失），fsync 按条数
+或时间批量进行（断电最多丢失一个批次）。日志行数远多于连接数时
+整理成每个连接一行。回填正常结束后 offset 写回配置，日志随即清空。
+"""
+
+import atexit
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from tgcf.config import CONFIG, Forward
+
+# 行数超过 连接数 × COMPACT_FACTOR + COMPACT_MIN 时整理
+COMPACT_FACTOR = 4
+COMPACT_MIN = 1000
+
+
+def checkpoint_key(forward: Forward) -> str:
+    dest = ",".join(str(d) for d in forward.dest)
+    return f"{forward.source}|{forward.con_name}|{dest}"
+
+
+class CheckpointJournal:
+    """追加写的 offset 日志。
+
+    每条记录带上该连接开始回填时配置里的 offset（base）：只有配置里的
+    offset 仍是 base 时才采用日志里的进度，手动修改过 offset 的连接
+    按新的配置重新开始。
+    """
+
+    def __init__(self, path: str, fsync_every: int, fsync_interval: float) -> None:
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        # key → (base, offset)
+        self.entries: Dict[str, Tuple[int, int]] = {}
+        self.bases: Dict[str, int] = {}
+        self.lines = 0
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+        self._load()
+        self.file = open(path, "a", encoding="utf8")
+
+    def _load(self) -> None:
+        complete = size = 0
+        try:
+            with open(self.path, "rb") as file:
+                for line in file:
+                    size += len(line)
+                    if not line.endswith(b"\n"):
+                        # 崩溃时写了一半的最后一行
+                        break
+                    complete = size
+                    try:
+                        record = json.loads(line)
+                        self.entries[record["k"]] = (record["b"], record["o"])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    self.lines += 1
+        except FileNotFoundError:
+            return
+        if size > complete:
+            # 截掉残行，否则下一条记录会接在它后面，同样无法解析
+            os.truncate(self.path, complete)
+            logging.warning(f"⚠️ 检查点日志末尾有不完整的记录，已截断 {size - complete} 字节")
+        if self.entries:
+            logging.info(f"📒 从检查点日志恢复了 {len(self.entries)} 个连接的进度")
+
+    def resume(self, forward: Forward) -> None:
+        """按日志恢复该连接的 offset，并记下本次回填的 base。"""
+        key = checkpoint_key(forward)
+        self.bases[key] = forward.offset
+        entry = self.entries.get(key)
+        if (
+            entry is not None
+            and entry[0] == forward.offset
+            and entry[1] > forward.offset
+        ):
+            logging.info(f"📒 {key} 从检查点 {entry[1]} 继续（配置中为 {forward.offset}）")
+            forward.offset = entry[1]
+
+    def record(self, forward: Forward, offset: int) -> None:
+        """更新连接的 offset 并追加一条记录。"""
+        forward.offset = offset
+        key = checkpoint_key(forward)
+        base = self.bases.setdefault(key, offset)
+        self.entries[key] = (base, offset)
+        self.file.write(json.dumps({"k": key, "b": base, "o": offset}) + "\n")
+        self.file.flush()
+        self.lines += 1
+        self.unsynced += 1
+        if (
+            self.unsynced >= self.fsync_every
+            or time.monotonic() - self.synced_at >= self.fsync_interval
+        ):
+            self.sync()
+        if self.lines > len(self.entries) * COMPACT_FACTOR + COMPACT_MIN:
+            self.compact()
+
+    def sync(self) -> None:
+        if self.file.closed or not self.unsynced:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def _rewrite(self) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf8") as file:
+            for key, (base, offset) in self.entries.items():
+                file.write(json.dumps({"k": key, "b": base, "o": offset}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self.file.close()
+        os.replace(tmp, self.path)
+        self.file = open(self.path, "a", encoding="utf8")
+        self.lines = len(self.entries)
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def compact(self) -> None:
+        """把日志整理成每个连接一行。"""
+        try:
+            self._rewrite()
+        except OSError as err:
+            logging.error(f"❌ 检查点日志整理失败: {err}")
+
+    def clear(self) -> None:
+        """offset 已写回配置后清空日志。"""
+        self.entries = {}
+        self.bases = {}
+        self.compact()
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+        try:
+            self.sync()
+        except OSError as err:
+            logging.error(f"❌ 检查点日志写入失败: {err}")
+        self.file.close()
+
+
+_journal: Optional[CheckpointJournal] = None
+
+
+def get_checkpoints() -> CheckpointJournal:
+    global _journal
+    if _journal is None:
+        settings = CONFIG.checkpoint
+        _journal = CheckpointJournal(
+            settings.path, settings.fsync_every, settings.fsync_interval
+        )
+        atexit.register(_journal.close)
+    return _journal
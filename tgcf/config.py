@@ -12,7 +12,7 @@ from telethon import TelegramClient
 from telethon.sessions import StringSession
 
 from tgcf import storage as stg
-from tgcf.const import CONFIG_FILE_NAME
+from tgcf.const import CONFIG_FILE_NAME, KEEP_LAST_MANY
 from tgcf.plugin_models import PluginConfig
 
 pwd = os.getcwd()
@@ -38,12 +38,66 @@ class LiveSettings(BaseModel):
     sequential_updates: bool = False
     delete_sync: bool = False
     delete_on_edit: Optional[str] = ".deleteMe"
+    concurrent_fanout: bool = False
+    source_concurrency: int = 5
+    global_concurrency: int = 20
+    delete_coalesce: float = 0.5
+    album_min_wait: float = 0.3
+    album_max_wait: float = 1.5
+    album_max_buffered: int = 500
+    album_max_bytes: int = 256 * 1024 * 1024
+    dispatch_workers: int = 0
+    dispatch_queue_size: int = 1000
+    ordering: str = "none"  # none, source, pair
+    edit_debounce: float = 0
+    edit_max_delay: float = 10
+
+    @validator("source_concurrency", "global_concurrency", "dispatch_queue_size")
+    def validate_concurrency(cls, val):
+        if val < 1:
+            logging.warning("concurrency limits must be at least 1")
+            val = 1
+        return val
+
+    @validator("dispatch_workers")
+    def validate_workers(cls, val):
+        if val < 0:
+            logging.warning("dispatch_workers must not be negative")
+            val = 0
+        return val
+
+    @validator("ordering")
+    def validate_ordering(cls, val):
+        if val not in ("none", "source", "pair"):
+            logging.warning(f"unknown ordering {val}, using none")
+            val = "none"
+        return val
+
+    @validator("edit_debounce", "edit_max_delay")
+    def validate_edit_window(cls, val):
+        if val < 0:
+            logging.warning("edit debounce windows must not be negative")
+            val = 0
+        return val
 
 
 class PastSettings(BaseModel):
-    """Configuration for past mode."""
+    """Configuration for past mode.
+
+    ``delay`` is the starting gap between messages. With ``adaptive`` the
+    pace speeds up while sends succeed and, after a FloodWait, backs off to
+    at most one message every ``max_delay`` seconds. Up to ``parallelism``
+    connections are backfilled at the same time. Within a connection,
+    ``workers`` messages go through plugins concurrently, at most
+    ``lookahead`` messages or albums ahead of the one being sent.
+    """
 
     delay: int = 0
+    adaptive: bool = True
+    max_delay: int = 300
+    parallelism: int = 3
+    workers: int = 2
+    lookahead: int = 10
 
     @validator("delay")
     def validate_delay(cls, val):
@@ -55,6 +109,139 @@ class PastSettings(BaseModel):
                 val = 0
         return val
 
+    @validator("max_delay")
+    def validate_max_delay(cls, val):
+        if val < 1:
+            logging.warning("max_delay must be at least 1 second")
+            val = 1
+        return val
+
+    @validator("parallelism", "workers", "lookahead")
+    def validate_parallelism(cls, val):
+        if val < 1:
+            logging.warning("past mode parallelism settings must be at least 1")
+            val = 1
+        return val
+
+
+class RateLimitSettings(BaseModel):
+    """Proactive rate limits shared by every send path.
+
+    Defaults follow Telegram's published limits for bots.
+    """
+
+    enabled: bool = True
+    global_per_second: float = 30
+    account_per_second: float = 20
+    chat_per_second: float = 1
+    group_per_minute: int = 20
+    burst: int = 3
+
+    @validator("global_per_second", "account_per_second", "chat_per_second")
+    def validate_rate(cls, val):
+        if val <= 0:
+            logging.warning("rate limits must be positive")
+            val = 1
+        return val
+
+    @validator("group_per_minute", "burst")
+    def validate_count(cls, val):
+        if val < 1:
+            logging.warning("rate limit counts must be at least 1")
+            val = 1
+        return val
+
+
+class MappingSettings(BaseModel):
+    """Where the source → destination message id mapping is kept.
+
+    backend is either "sqlite" (persistent file) or "memory".
+    """
+
+    backend: str = "sqlite"
+    path: str = "tgcf.mapping.db"
+    cache_size: int = KEEP_LAST_MANY
+    batch_size: int = 200
+    flush_interval: float = 2.0
+
+    @validator("backend")
+    def validate_backend(cls, val):
+        if val not in ("sqlite", "memory"):
+            logging.warning(f"unknown mapping backend {val}, using sqlite")
+            val = "sqlite"
+        return val
+
+
+class CheckpointSettings(BaseModel):
+    """Append-only journal of past mode offsets.
+
+    Each checkpoint appends one line instead of rewriting the config.
+    Lines reach the OS immediately and are fsynced every fsync_every
+    lines or fsync_interval seconds, whichever comes first.
+    """
+
+    path: str = "tgcf.checkpoint.jsonl"
+    fsync_every: int = 100
+    fsync_interval: float = 5.0
+
+    @validator("fsync_every")
+    def validate_fsync_every(cls, val):
+        if val < 1:
+            logging.warning("fsync_every must be at least 1")
+            val = 1
+        return val
+
+
+class DedupSettings(BaseModel):
+    """Drop messages whose content was already sent to a destination.
+
+    Messages are fingerprinted by photo/document id and normalized text.
+    ttl is in seconds. The bloom filter remembers fingerprints beyond
+    cache_size at the cost of about bloom_error_rate false positives,
+    unless persist is on, in which case hits are confirmed on disk.
+    """
+
+    enabled: bool = False
+    ttl: float = 24 * 60 * 60
+    cache_size: int = 100000
+    bloom: bool = False
+    bloom_capacity: int = 1000000
+    bloom_error_rate: float = 0.001
+    persist: bool = False
+    path: str = "tgcf.dedup.db"
+    batch_size: int = 200
+
+    @validator("ttl", "cache_size", "bloom_capacity", "batch_size")
+    def validate_positive(cls, val):
+        if val <= 0:
+            logging.warning("dedup sizes and ttl must be positive")
+            val = 1
+        return val
+
+    @validator("bloom_error_rate")
+    def validate_error_rate(cls, val):
+        if not 0 < val < 1:
+            logging.warning("bloom_error_rate must be between 0 and 1")
+            val = 0.001
+        return val
+
+
+class MediaSettings(BaseModel):
+    """Media downloads shared by plugins.
+
+    Files up to memory_limit bytes may be kept in memory instead of
+    on disk when a plugin only needs their bytes. 0 disables this.
+    """
+
+    memory_limit: int = 5 * 1024 * 1024
+
+    @validator("memory_limit")
+    def validate_memory_limit(cls, val):
+        if val < 0:
+            logging.warning("memory_limit must not be negative")
+            val = 0
+        return val
+
 
 class LoginConfig(BaseModel):
 
@@ -81,9 +268,15 @@ class Config(BaseModel):
     admins: List[Union[int, str]] = []
     forwards: List[Forward] = []
     show_forwarded_from: bool = False
+    server_copy: bool = False
     mode: int = 0  # 0: live, 1:past
     live: LiveSettings = LiveSettings()
     past: PastSettings = PastSettings()
+    rate_limit: RateLimitSettings = RateLimitSettings()
+    mapping: MappingSettings = MappingSettings()
+    checkpoint: CheckpointSettings = CheckpointSettings()
+    dedup: DedupSettings = DedupSettings()
+    media: MediaSettings = MediaSettings()
 
     plugins: PluginConfig = PluginConfig()
     bot_messages = BotMessages()
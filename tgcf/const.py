@@ -5,12 +5,22 @@ COMMANDS = {
     "forward": "Set a new forward",
     "remove": "Remove an existing forward",
     "help": "Learn usage",
+    "limits": "Show current rate limiter state",
 }
 
 REGISTER_COMMANDS = True
 
 KEEP_LAST_MANY = 10000
 
+MAX_SEND_ATTEMPTS = 5
+
+# Telethon 默认会在请求内部静默等待 60 秒以内的 FloodWait，限流器就观察不到；
+# 设为 0 让所有 FloodWait 都抛出，由 call_limited 上报并重试
+FLOOD_SLEEP_THRESHOLD = 0
+
+# Telegram 单次 delete_messages / forward_messages 最多 100 个 ID
+MAX_IDS_PER_REQUEST = 100
+
 CONFIG_FILE_NAME = "tgcf.config.json"
 CONFIG_ENV_VAR_NAME = "TGCF_CONFIG"
 
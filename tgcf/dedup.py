@@ -0,0 +1,290 @@
+"""跨来源的重复消息过滤。
+
+多个源转发到同一目标时，同一张图片或同一篇文章常会出现多次。
+这里给每条消息计算指纹（图片/文件 ID + 规范化后的文字），按目标记录
+最近发送过的指纹，在下载和插件处理之前丢弃重复内容。
+
+索引分三层：精确的 LRU 热缓存（带 TTL），可选的轮换 Bloom 过滤器，
+可选的 SQLite 持久化。Bloom 过滤器在开启持久化时用来省掉绝大多数
+"新消息" 的磁盘查询；未开启持久化时它记住 LRU 装不下的旧指纹，
+代价是约 error_rate 的误判。
+"""
+
+import atexit
+import hashlib
+import logging
+import math
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from telethon.tl.custom.message import Message
+
+from tgcf.config import CONFIG
+
+Key = Tuple[int, int]
+
+
+def _digest(data: bytes) -> int:
+    # 有符号 64 位，方便直接存进 SQLite INTEGER
+    return int.from_bytes(
+        hashlib.blake2b(data, digest_size=8).digest(), "big", signed=True
+    )
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def fingerprint(message: Message) -> Optional[int]:
+    """计算单条消息的内容指纹；无法可靠识别的消息返回 None（不去重）。"""
+    parts = []
+    if message.photo:
+        parts.append(f"p{message.photo.id}")
+    elif message.document:
+        parts.append(f"d{message.document.id}")
+    elif message.media and not message.web_preview:
+        # 投票、位置等内容没有稳定的 ID
+        return None
+    text = _normalize(message.raw_text or "")
+    if text:
+        parts.append(text)
+    if not parts:
+        return None
+    return _digest("\x00".join(parts).encode())
+
+
+def group_fingerprint(messages: Iterable[Message]) -> Optional[int]:
+    """媒体组的指纹：任一成员无法识别时整个组不去重。"""
+    fps = []
+    for message in messages:
+        fp = fingerprint(message)
+        if fp is None:
+            return None
+        fps.append(str(fp))
+    if not fps:
+        return None
+    return _digest(",".join(fps).encode())
+
+
+class BloomFilter:
+    """固定大小的 Bloom 过滤器，k 个位置由双重哈希得到。"""
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        bits = -capacity * math.log(error_rate) / (math.log(2) ** 2)
+        self.size = max(8, int(bits))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: Key) -> Iterable[int]:
+        # 整数元组的 hash 分布不够均匀，再乘一个奇数常数打散
+        x = (hash(key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = x & 0xFFFFFFFF, (x >> 32) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: Key) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: Key) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RotatingBloom:
+    """两代 Bloom 过滤器轮换：当前代写满或超过 ttl 时丢弃最旧的一代。"""
+
+    def __init__(self, capacity: int, error_rate: float, ttl: float) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.ttl = ttl
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous: Optional[BloomFilter] = None
+        self.started = time.monotonic()
+
+    def _maybe_rotate(self) -> None:
+        if (
+            self.current.count >= self.capacity
+            or time.monotonic() - self.started >= self.ttl
+        ):
+            self.previous = self.current
+            self.current = BloomFilter(self.capacity, self.error_rate)
+            self.started = time.monotonic()
+
+    def add(self, key: Key) -> None:
+        self._maybe_rotate()
+        self.current.add(key)
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self.current or (
+            self.previous is not None and key in self.previous
+        )
+
+
+class SqliteSeen:
+    """持久化的 (目标, 指纹) → 首次发送时间。写入批量提交。"""
+
+    def __init__(self, path: str, batch_size: int, ttl: float) -> None:
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            " dest INTEGER NOT NULL,"
+            " fp INTEGER NOT NULL,"
+            " ts REAL NOT NULL,"
+            " PRIMARY KEY (dest, fp)"
+            ") WITHOUT ROWID"
+        )
+        self.conn.commit()
+        self.batch_size = batch_size
+        self.ttl = ttl
+        self.pending: Dict[Key, float] = {}
+
+    def seen_since(self, key: Key, since: float) -> bool:
+        if key in self.pending:
+            return self.pending[key] >= since
+        cur = self.conn.execute(
+            "SELECT 1 FROM seen WHERE dest=? AND fp=? AND ts>=?", (*key, since)
+        )
+        return cur.fetchone() is not None
+
+    def recent(self, since: float) -> Iterable[Key]:
+        return self.conn.execute("SELECT dest, fp FROM seen WHERE ts>=?", (since,))
+
+    def add(self, key: Key, ts: float) -> None:
+        self.pending[key] = ts
+        if len(self.pending) >= self.batch_size:
+            # 顺带清掉过期记录，数据库大小只与 ttl 内的发送量有关
+            self.flush(expire_before=time.time() - self.ttl)
+
+    def discard(self, key: Key) -> None:
+        self.pending.pop(key, None)
+
+    def flush(self, expire_before: Optional[float] = None) -> None:
+        try:
+            if self.pending:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO seen VALUES (?, ?, ?)",
+                    [(*key, ts) for key, ts in self.pending.items()],
+                )
+                self.pending = {}
+            if expire_before is not None:
+                self.conn.execute("DELETE FROM seen WHERE ts<?", (expire_before,))
+            self.conn.commit()
+        except sqlite3.Error as err:
+            logging.error(f"❌ 去重索引写入失败: {err}")
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+
+class DedupIndex:
+    """按目标记录已发送指纹的索引。
+
+    claim 在发送前占位（同时到达的重复消息只有一个能通过），
+    发送成功后 confirm 写入 Bloom 与持久层，失败时 release 撤销占位。
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        cache_size: int,
+        bloom: Optional[RotatingBloom] = None,
+        store: Optional[SqliteSeen] = None,
+    ) -> None:
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.bloom = bloom
+        self.store = store
+        self._cache: "OrderedDict[Key, float]" = OrderedDict()
+        self.dropped = 0
+        if store is not None and bloom is not None:
+            for key in store.recent(time.time() - ttl):
+                bloom.add(tuple(key))
+
+    def seen(self, dest: int, fp: int) -> bool:
+        key = (dest, fp)
+        now = time.time()
+        ts = self._cache.get(key)
+        if ts is not None:
+            if now - ts < self.ttl:
+                return True
+            del self._cache[key]
+        if self.bloom is not None and key not in self.bloom:
+            return False
+        if self.store is not None:
+            # 以数据库为准确认 Bloom 的命中
+            return self.store.seen_since(key, now - self.ttl)
+        return self.bloom is not None
+
+    def claim(self, dests: List[int], fp: Optional[int]) -> List[int]:
+        """返回该指纹尚未发送过的目标，并为它们占位。"""
+        if fp is None:
+            return dests
+        fresh = []
+        now = time.time()
+        for d in dests:
+            if self.seen(d, fp):
+                self.dropped += 1
+                continue
+            self._cache[(d, fp)] = now
+            fresh.append(d)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return fresh
+
+    def confirm(self, dest: int, fp: Optional[int]) -> None:
+        if fp is None:
+            return
+        key = (dest, fp)
+        if self.bloom is not None:
+            self.bloom.add(key)
+        if self.store is not None:
+            self.store.add(key, self._cache.get(key, time.time()))
+
+    def release(self, dest: int, fp: Optional[int]) -> None:
+        if fp is None:
+            return
+        key = (dest, fp)
+        self._cache.pop(key, None)
+        if self.store is not None:
+            self.store.discard(key)
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.flush(expire_before=time.time() - self.ttl)
+            self.store.close()
+            self.store = None
+
+
+_index: Optional[DedupIndex] = None
+
+
+def get_dedup() -> Optional[DedupIndex]:
+    """未开启去重时返回 None。"""
+    global _index
+    settings = CONFIG.dedup
+    if not settings.enabled:
+        return None
+    if _index is None:
+        bloom = None
+        if settings.bloom:
+            bloom = RotatingBloom(
+                settings.bloom_capacity, settings.bloom_error_rate, settings.ttl
+            )
+        store = None
+        if settings.persist:
+            try:
+                store = SqliteSeen(settings.path, settings.batch_size, settings.ttl)
+            except sqlite3.Error as err:
+                logging.error(f"❌ 无法打开去重数据库 {settings.path}: {err}")
+        _index = DedupIndex(settings.ttl, settings.cache_size, bloom, store)
+        atexit.register(_index.close)
+        logging.info("🧬 已开启跨来源去重")
+    return _index
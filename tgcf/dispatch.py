@@ -0,0 +1,188 @@
+"""live 模式的任务分发：有界队列 + 发送 worker 池。
+
+事件处理器只负责把任务放进队列后立即返回，由固定数量的 worker
+执行插件与发送。积压任务数有上限，达到上限时 submit 会等待，
+对更新接收形成反压，积压超过高水位时记录日志。
+
+任务可以带一个 key：同一个 key 的任务严格按提交顺序逐个执行，
+不同 key 之间由 worker 并行执行。
+
+Debouncer 用于把短时间内针对同一对象的多次事件合并成一次。
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+Job = Callable[..., Awaitable[Any]]
+KeyFunc = Callable[[Any], Optional[Hashable]]
+
+# 积压超过该比例时告警，回落到一半以下时恢复
+HIGH_WATER_RATIO = 0.8
+
+
+class Dispatcher:
+    """有界任务队列与 worker 池，支持按 key 保序。"""
+
+    def __init__(self, workers: int, maxsize: int) -> None:
+        self.workers = workers
+        self.maxsize = maxsize
+        self.queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        # 正在执行的 key → 等待在它后面的任务
+        self._busy: Dict[Hashable, Deque[Tuple[Job, tuple]]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._above_high_water = False
+        self.pending = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        self.queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.maxsize)
+        self._tasks = [
+            asyncio.ensure_future(self._worker(n)) for n in range(self.workers)
+        ]
+        logging.info(f"🧵 启动 {self.workers} 个发送 worker，队列上限 {self.maxsize}")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(
+        self, job: Job, *args: Any, key: Optional[Hashable] = None
+    ) -> None:
+        """提交任务；积压已满时等待（反压）。"""
+        await self._slots.acquire()
+        self.pending += 1
+        self._check_water_mark()
+        self.queue.put_nowait((key, job, args))
+
+    def _check_water_mark(self) -> None:
+        if (
+            not self._above_high_water
+            and self.pending >= self.maxsize * HIGH_WATER_RATIO
+        ):
+            self._above_high_water = True
+            logging.warning(f"⚠️ 发送队列积压 {self.pending}/{self.maxsize}")
+        elif self._above_high_water and self.pending <= self.maxsize / 2:
+            self._above_high_water = False
+            logging.info(f"✅ 发送队列回落到 {self.pending}/{self.maxsize}")
+
+    async def _run(self, n: int, job: Job, args: tuple) -> None:
+        try:
+            await job(*args)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logging.exception(f"❌ worker {n} 执行任务失败: {e}")
+        finally:
+            self.pending -= 1
+            self._slots.release()
+            self._check_water_mark()
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            key, job, args = await self.queue.get()
+            if key is None:
+                await self._run(n, job, args)
+                continue
+            if key in self._busy:
+                # 同 key 的任务正在别的 worker 上执行，排到它后面
+                self._busy[key].append((job, args))
+                continue
+            self._busy[key] = deque()
+            try:
+                await self._run(n, job, args)
+                while self._busy[key]:
+                    job, args = self._busy[key].popleft()
+                    await self._run(n, job, args)
+            finally:
+                del self._busy[key]
+
+    def wrap(self, handler: Job, key_func: Optional[KeyFunc] = None) -> Job:
+        """把事件处理器包装成只负责入队的处理器。"""
+
+        async def enqueue(event) -> None:
+            key = key_func(event) if key_func else None
+            await self.submit(handler, event, key=key)
+
+        enqueue.__name__ = handler.__name__
+        return enqueue
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "maxsize": self.maxsize,
+            "active_keys": len(self._busy),
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+
+class Debouncer:
+    """同一个 key 在窗口期内的多次事件只处理最后一次。
+
+    每来一次新事件就把计时重置为 window 秒，但从第一次事件算起
+    最多等待 max_delay 秒，避免连续编辑时一直不处理。
+    """
+
+    def __init__(self, window: float, max_delay: float) -> None:
+        self.window = window
+        self.max_delay = max(max_delay, window)
+        # key → (最新事件, 第一次出现的时间, 定时器)
+        self._pending: Dict[Hashable, Tuple[Any, float, asyncio.TimerHandle]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.coalesced = 0
+
+    def wrap(self, handler: Job, key_func: KeyFunc) -> Job:
+        async def debounced(event) -> None:
+            key = key_func(event)
+            if key is None or self.window <= 0:
+                await handler(event)
+                return
+            self._schedule(key, event, handler)
+
+        debounced.__name__ = handler.__name__
+        return debounced
+
+    def _schedule(self, key: Hashable, event: Any, handler: Job) -> None:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        first_seen = now
+        if key in self._pending:
+            _, first_seen, timer = self._pending[key]
+            timer.cancel()
+            self.coalesced += 1
+        delay = max(0.0, min(self.window, first_seen + self.max_delay - now))
+        timer = loop.call_later(delay, self._fire, key, handler)
+        self._pending[key] = (event, first_seen, timer)
+
+    def _fire(self, key: Hashable, handler: Job) -> None:
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return
+        task = asyncio.ensure_future(self._run(handler, entry[0]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, handler: Job, event: Any) -> None:
+        try:
+            await handler(event)
+        except Exception as e:
+            logging.exception(f"❌ 处理合并后的事件失败: {e}")
@@ -1,62 +1,272 @@
 # tgcf/live.py
 
 import asyncio
+import copy
+import hashlib
 import logging
-from typing import Union, List
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
 
 from telethon import TelegramClient, events
 from telethon.tl.custom.message import Message
+from telethon.tl.types import PeerChannel
+from telethon.utils import resolve_id
 
 from tgcf import config, const
-from tgcf import storage as st
+from tgcf.album import AlbumAssembler
 from tgcf.bot import get_events
 from tgcf.config import CONFIG, get_SESSION
+from tgcf.dedup import fingerprint, get_dedup, group_fingerprint
+from tgcf.dispatch import Debouncer, Dispatcher
+from tgcf.mapping import get_mapping, msg_ids
 from tgcf.plugins import apply_plugins, apply_plugins_to_group, load_async_plugins
-from tgcf.utils import clean_session_files, send_message
+from tgcf.utils import (
+    call_limited,
+    clean_session_files,
+    send_message,
+    warm_peer_cache,
+)
+
+# 并发分发：每个源一个信号量，外加一个全局信号量
+_SOURCE_SEMAPHORES: Dict[int, asyncio.Semaphore] = {}
+_GLOBAL_SEMAPHORE: Optional[asyncio.Semaphore] = None
+
+
+def _source_semaphore(chat_id: int) -> asyncio.Semaphore:
+    sem = _SOURCE_SEMAPHORES.get(chat_id)
+    if sem is None:
+        sem = asyncio.Semaphore(CONFIG.live.source_concurrency)
+        _SOURCE_SEMAPHORES[chat_id] = sem
+    return sem
+
+
+def _global_semaphore() -> asyncio.Semaphore:
+    global _GLOBAL_SEMAPHORE
+    if _GLOBAL_SEMAPHORE is None:
+        _GLOBAL_SEMAPHORE = asyncio.Semaphore(CONFIG.live.global_concurrency)
+    return _GLOBAL_SEMAPHORE
+
+
+# ordering == "pair" 时每个 (源, 目标) 一把 FIFO 锁，以及仍在后台发送的任务
+_PAIR_LOCKS: Dict[Tuple[int, int], asyncio.Lock] = {}
+_PAIR_TASKS: Set[asyncio.Future] = set()
+# 每个 (源, 目标) 已排队但尚未完成的操作数（任务创建时即计入）
+_PAIR_QUEUED: Dict[Tuple[int, int], int] = {}
+
+
+def _track(task: asyncio.Future) -> None:
+    _PAIR_TASKS.add(task)
+    task.add_done_callback(_PAIR_TASKS.discard)
+
+
+async def _send_in_pair_order(
+    chat_id: int, d: int, send_one: Callable[[int], Awaitable[None]]
+) -> None:
+    key = (chat_id, d)
+    lock = _PAIR_LOCKS.get(key)
+    if lock is None:
+        lock = _PAIR_LOCKS[key] = asyncio.Lock()
+    try:
+        async with lock, _global_semaphore():
+            await send_one(d)
+    finally:
+        _PAIR_QUEUED[key] -= 1
+        if not _PAIR_QUEUED[key]:
+            del _PAIR_QUEUED[key]
+
+
+def _pair_pending(chat_id: int, dest: List[int]) -> bool:
+    """pair 模式下该源是否还有排队或正在执行的目标操作。"""
+    if CONFIG.live.ordering != "pair":
+        return False
+    return any((chat_id, d) in _PAIR_QUEUED for d in dest)
+
+
+async def _after(tasks: List[asyncio.Future], done: Callable[[], None]) -> None:
+    await asyncio.gather(*tasks, return_exceptions=True)
+    done()
+
+
+async def _fan_out(
+    chat_id: int,
+    dest: List[int],
+    send_one: Callable[[int], Awaitable[None]],
+    done: Optional[Callable[[], None]] = None,
+) -> None:
+    """把同一个源的操作分发到所有目标，全部结束后调用 done。
+
+    ordering 为 "pair" 时每个目标的操作在后台按 (源, 目标) 顺序排队，
+    函数立即返回；开启 concurrent_fanout 时所有目标并发执行，受每个源与
+    全局并发上限约束；否则逐个目标顺序执行。send_one 负责记录自己的结果与异常。
+    """
+    if CONFIG.live.ordering == "pair":
+        # 任务按创建顺序排到各自的锁上，保证同一 (源, 目标) 的先后顺序
+        for d in dest:
+            _PAIR_QUEUED[(chat_id, d)] = _PAIR_QUEUED.get((chat_id, d), 0) + 1
+        tasks = [
+            asyncio.ensure_future(_send_in_pair_order(chat_id, d, send_one))
+            for d in dest
+        ]
+        for task in tasks:
+            _track(task)
+        if done is not None:
+            _track(asyncio.ensure_future(_after(tasks, done)))
+        return
+
+    try:
+        await _fan_out_now(chat_id, dest, send_one)
+    finally:
+        if done is not None:
+            done()
 
 
-async def _send_grouped_messages(grouped_id: int) -> None:
-    """发送缓存中的媒体组"""
-    if grouped_id not in st.GROUPED_CACHE:
+async def _fan_out_now(
+    chat_id: int, dest: List[int], send_one: Callable[[int], Awaitable[None]]
+) -> None:
+    if not CONFIG.live.concurrent_fanout or len(dest) < 2:
+        for d in dest:
+            await send_one(d)
         return
 
-    chat_messages_map = st.GROUPED_CACHE[grouped_id]
-    for chat_id, messages in chat_messages_map.items():
-        if chat_id not in config.from_to:
-            continue
+    source_sem = _source_semaphore(chat_id)
+    global_sem = _global_semaphore()
 
-        dest = config.from_to.get(chat_id)
+    async def _guarded(d: int) -> None:
+        async with source_sem, global_sem:
+            await send_one(d)
 
-        tms = await apply_plugins_to_group(messages)
-        if not tms:
-            continue
+    results = await asyncio.gather(*(_guarded(d) for d in dest), return_exceptions=True)
+    for d, res in zip(dest, results):
+        if isinstance(res, Exception):
+            logging.error(f"❌ 并发分发到 {d} 失败: {res}")
+
+
+# 每条源消息在各目标上最后一次发出的文字摘要，用于跳过没有变化的编辑
+_SENT_DIGESTS: "OrderedDict[Tuple[int, int], Dict[int, bytes]]" = OrderedDict()
+
+
+def _text_digest(text: str) -> bytes:
+    return hashlib.blake2b((text or "").encode(), digest_size=16).digest()
+
+
+def _sent_digests(chat_id: int, msg_id: int) -> Dict[int, bytes]:
+    key = (chat_id, msg_id)
+    digests = _SENT_DIGESTS.get(key)
+    if digests is None:
+        digests = _SENT_DIGESTS[key] = {}
+        if len(_SENT_DIGESTS) > const.KEEP_LAST_MANY:
+            _SENT_DIGESTS.popitem(last=False)
+    else:
+        _SENT_DIGESTS.move_to_end(key)
+    return digests
+
+
+def _claim_fresh(
+    chat_id: int, dest: List[int], fp: Optional[int]
+) -> Tuple[List[int], Callable[[int, bool], None]]:
+    """去重：返回还没收到过该内容的目标，以及发送结束后的回调 settle(d, ok)。"""
+    dedup = get_dedup()
+    if dedup is None or fp is None:
+        return dest, lambda d, ok: None
+
+    fresh = dedup.claim(dest, fp)
+    if len(fresh) < len(dest):
+        logging.info(f"⏭️ 重复内容，跳过 {len(dest) - len(fresh)} 个目标 @ {chat_id}")
+
+    def settle(d: int, ok: bool) -> None:
+        if ok:
+            dedup.confirm(d, fp)
+        else:
+            dedup.release(d, fp)
+
+    return fresh, settle
 
-        tm_template = tms[0]
 
+async def _send_grouped_messages(chat_id: int, messages: List[Message]) -> None:
+    """发送组装好的媒体组"""
+    if chat_id not in config.from_to:
+        return
+
+    dest, settle = _claim_fresh(
+        chat_id, config.from_to.get(chat_id), group_fingerprint(messages)
+    )
+    if not dest:
+        return
+
+    tms = await apply_plugins_to_group(messages)
+    if not tms:
         for d in dest:
-            try:
-                fwded_msgs = await send_message(
-                    d,
-                    tm_template,
-                    grouped_messages=[tm.message for tm in tms],
-                    grouped_tms=tms,
-                )
-
-                for i, original_msg in enumerate(messages):
-                    event_uid = st.EventUid(st.DummyEvent(chat_id, original_msg.id))
-                    if event_uid not in st.stored:
-                        st.stored[event_uid] = {}
-                    if isinstance(fwded_msgs, list) and i < len(fwded_msgs):
-                        st.stored[event_uid][d] = fwded_msgs[i]
-                    elif not isinstance(fwded_msgs, list):
-                        st.stored[event_uid][d] = fwded_msgs
-
-            except Exception as e:
-                logging.critical(f"🚨 live 模式组播失败: {e}")
-
-    st.GROUPED_CACHE.pop(grouped_id, None)
-    st.GROUPED_TIMERS.pop(grouped_id, None)
-    st.GROUPED_MAPPING.pop(grouped_id, None)
+            settle(d, False)
+        return
+
+    tm_template = tms[0]
+    mapping = get_mapping()
+
+    async def _send(d: int) -> None:
+        ok = False
+        try:
+            fwded_msgs = await send_message(
+                d,
+                tm_template,
+                grouped_messages=[tm.message for tm in tms],
+                grouped_tms=tms,
+            )
+
+            fwded_ids = msg_ids(fwded_msgs)
+            for original_msg, fwded_id in zip(messages, fwded_ids):
+                if fwded_id is not None:
+                    mapping.set(chat_id, original_msg.id, d, fwded_id)
+                    ok = True
+
+        except Exception as e:
+            logging.critical(f"🚨 live 模式组播失败: {e}")
+        finally:
+            settle(d, ok)
+
+    def _clear() -> None:
+        for tm in tms:
+            tm.clear()
+
+    await _fan_out(chat_id, dest, _send, done=_clear)
+
+
+# 发送 worker 池；dispatch_workers 为 0 时处理器在事件回调中直接执行
+dispatcher: Optional[Dispatcher] = (
+    Dispatcher(CONFIG.live.dispatch_workers, CONFIG.live.dispatch_queue_size)
+    if CONFIG.live.dispatch_workers > 0
+    else None
+)
+
+# 这些处理器走 worker 池，bot 命令仍然直接处理
+DISPATCHED_EVENTS = {"new", "edited", "deleted"}
+
+
+def _ordering_key(event) -> Optional[int]:
+    """按源会话保序；删除事件没有 chat_id 时不保序。"""
+    if CONFIG.live.ordering == "none":
+        return None
+    return event.chat_id
+
+
+async def _dispatch(job, *args, key: Optional[int] = None) -> None:
+    if dispatcher is None:
+        await job(*args)
+    else:
+        await dispatcher.submit(job, *args, key=key)
+
+
+async def _on_album_ready(chat_id: int, messages: List[Message]) -> None:
+    key = None if CONFIG.live.ordering == "none" else chat_id
+    await _dispatch(_send_grouped_messages, chat_id, messages, key=key)
+
+
+albums = AlbumAssembler(
+    _on_album_ready,
+    min_wait=CONFIG.live.album_min_wait,
+    max_wait=CONFIG.live.album_max_wait,
+    max_messages=CONFIG.live.album_max_buffered,
+    max_bytes=CONFIG.live.album_max_bytes,
+)
 
 
 async def new_message_handler(event: Union[Message, events.NewMessage]) -> None:
@@ -66,33 +276,49 @@ async def new_message_handler(event: Union[Message, events.NewMessage]) -> None:
 
     message = event.message
     if message.grouped_id is not None:
-        st.add_to_group_cache(chat_id, message.grouped_id, message)
+        albums.add(chat_id, message)
         return
 
-    event_uid = st.EventUid(event)
-    if len(st.stored) > const.KEEP_LAST_MANY:
-        del st.stored[next(iter(st.stored))]
+    # 在下载与插件处理之前丢弃重复内容
+    dest, settle = _claim_fresh(
+        chat_id, config.from_to.get(chat_id), fingerprint(message)
+    )
+    if not dest:
+        return
 
-    dest = config.from_to.get(chat_id)
     tm = await apply_plugins(message)
     if not tm:
+        for d in dest:
+            settle(d, False)
         return
 
-    st.stored[event_uid] = {}
-    for d in dest:
-        if event.is_reply:
-            r_event = st.DummyEvent(chat_id, event.reply_to_msg_id)
-            r_event_uid = st.EventUid(r_event)
-            if r_event_uid in st.stored:
-                tm.reply_to = st.stored[r_event_uid].get(d)
+    mapping = get_mapping()
+    digest = _text_digest(tm.text)
+    digests = _sent_digests(chat_id, message.id)
 
+    async def _send(d: int) -> None:
+        dtm = tm
+        if event.is_reply:
+            # 发送时再查：按 (源, 目标) 排队时被回复的消息可能刚刚发出
+            replied = mapping.get(chat_id, event.reply_to_msg_id)
+            if replied:
+                # 每个目标的 reply_to 不同，并发时不能共享同一个 tm
+                dtm = copy.copy(tm)
+                dtm.reply_to = replied.get(d)
+
+        ok = False
         try:
-            fwded_msg = await send_message(d, tm)
-            st.stored[event_uid][d] = fwded_msg
+            fwded_ids = msg_ids(await send_message(d, dtm))
+            if fwded_ids and fwded_ids[0] is not None:
+                mapping.set(chat_id, message.id, d, fwded_ids[0])
+                digests[d] = digest
+                ok = True
         except Exception as e:
             logging.error(f"❌ live 单条发送失败: {e}")
+        finally:
+            settle(d, ok)
 
-    tm.clear()
+    await _fan_out(chat_id, dest, _send, done=tm.clear)
 
 
 async def edited_message_handler(event) -> None:
@@ -100,59 +326,193 @@ async def edited_message_handler(event) -> None:
     if chat_id not in config.from_to:
         return
 
-    event_uid = st.EventUid(event)
-    if event_uid not in st.stored:
+    mapping = get_mapping()
+    dest = config.from_to.get(chat_id, [])
+    # pair 模式下原消息可能还排在发送队列里，映射要到执行时再查
+    if not mapping.get(chat_id, event.id) and not _pair_pending(chat_id, dest):
         return
 
     # 检查是否触发 delete_on_edit
     if CONFIG.live.delete_on_edit and event.message.text == CONFIG.live.delete_on_edit:
-        dest = config.from_to.get(chat_id, [])
-        for d in dest:
-            fwded = st.stored[event_uid].get(d)
-            if fwded:
+
+        async def _delete(d: int) -> None:
+            mid = mapping.get(chat_id, event.id).get(d)
+            if mid:
                 try:
-                    mid = fwded.id if hasattr(fwded, "id") else fwded
-                    await event.client.delete_messages(d, mid)
+                    await call_limited(
+                        event.client,
+                        d,
+                        lambda: event.client.delete_messages(d, mid),
+                        "delete_on_edit 删除目标",
+                        attempts=1,
+                    )
                 except Exception as e:
                     logging.error(f"❌ delete_on_edit 删除目标失败: {e}")
+
+        await _fan_out(
+            chat_id, dest, _delete, done=lambda: mapping.pop(chat_id, event.id)
+        )
         try:
             await event.message.delete()
         except Exception as e:
             logging.error(f"❌ delete_on_edit 删除源失败: {e}")
-        del st.stored[event_uid]
         return
 
-    dest = config.from_to.get(chat_id, [])
-    tm = await apply_plugins(event.message)
+    # 编辑只同步文字，跳过水印等只处理媒体的插件
+    tm = await apply_plugins(event.message, text_only=True)
     if not tm:
         return
 
-    for d in dest:
-        fwded = st.stored[event_uid].get(d)
-        if fwded:
-            try:
-                mid = fwded.id if hasattr(fwded, "id") else fwded
-                await event.client.edit_message(d, mid, tm.text)
-            except Exception as e:
-                logging.error(f"❌ 编辑同步失败: {e}")
-    tm.clear()
+    digest = _text_digest(tm.text)
+    digests = _sent_digests(chat_id, event.id)
 
+    async def _edit(d: int) -> None:
+        mid = mapping.get(chat_id, event.id).get(d)
+        if not mid:
+            return
+        if digests.get(d) == digest:
+            logging.info(f"⏭️ 编辑后内容未变化，跳过 {d}")
+            return
+        try:
+            await call_limited(
+                event.client,
+                d,
+                lambda: event.client.edit_message(d, mid, tm.text),
+                "编辑同步",
+                attempts=1,
+            )
+            digests[d] = digest
+        except Exception as e:
+            logging.error(f"❌ 编辑同步失败: {e}")
 
-async def deleted_message_handler(event) -> None:
-    for deleted_id in event.deleted_ids:
-        for chat_id in list(config.from_to.keys()):
-            r_event = st.DummyEvent(chat_id, deleted_id)
-            event_uid = st.EventUid(r_event)
-            if event_uid not in st.stored:
-                continue
-            dest_map = st.stored[event_uid]
-            for d, fwded in dest_map.items():
+    await _fan_out(chat_id, dest, _edit, done=tm.clear)
+
+
+edit_debouncer = Debouncer(CONFIG.live.edit_debounce, CONFIG.live.edit_max_delay)
+
+
+def _edit_key(event) -> Optional[Tuple[int, int]]:
+    """只合并需要同步的会话里的编辑。"""
+    if event.chat_id not in config.from_to:
+        return None
+    return (event.chat_id, event.id)
+
+
+class _DeleteBatcher:
+    """在短暂的合并窗口内收集删除，按目标合并成 delete_messages 调用。"""
+
+    def __init__(self) -> None:
+        self.pending: Dict[int, List[int]] = {}
+        self.client: Optional[TelegramClient] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def add(self, client: TelegramClient, dest: int, ids: List[int]) -> None:
+        self.client = client
+        self.pending.setdefault(dest, []).extend(ids)
+        if CONFIG.live.delete_coalesce <= 0:
+            await self.flush()
+        elif self._task is None:
+            self._task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(CONFIG.live.delete_coalesce)
+        self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        pending, self.pending = self.pending, {}
+        client = self.client
+        for d, ids in pending.items():
+            for i in range(0, len(ids), const.MAX_IDS_PER_REQUEST):
+                chunk = ids[i : i + const.MAX_IDS_PER_REQUEST]
                 try:
-                    mid = fwded.id if hasattr(fwded, "id") else fwded
-                    await event.client.delete_messages(d, mid)
+                    await call_limited(
+                        client,
+                        d,
+                        lambda: client.delete_messages(d, chunk),
+                        "删除同步",
+                        attempts=1,
+                    )
+                    logging.info(f"🗑️ 删除同步 {d}: {len(chunk)} 条")
                 except Exception as e:
                     logging.error(f"❌ 删除同步失败: {e}")
-            del st.stored[event_uid]
+
+
+_delete_batcher = _DeleteBatcher()
+
+
+def _is_channel(chat_id: int) -> bool:
+    return resolve_id(chat_id)[1] is PeerChannel
+
+
+def _deleted_sources(deleted_id: int, chat_id: Optional[int]) -> List[int]:
+    """按消息 ID 反查被删消息的源会话。
+
+    没有 chat_id 的删除事件来自私聊或群组，频道的消息 ID 自成一套，
+    同号的频道消息与之无关。
+    """
+    if chat_id is not None:
+        return get_mapping().find(deleted_id, chat_id)
+    return [src for src in get_mapping().find(deleted_id) if not _is_channel(src)]
+
+
+async def _delete_in_pair_order(event, chat_id: Optional[int]) -> None:
+    """pair 模式：删除排在同一 (源, 目标) 的发送之后，执行时再查映射。"""
+    mapping = get_mapping()
+    ids = list(event.deleted_ids)
+    if chat_id is not None:
+        sources = {chat_id}
+    else:
+        sources = set()
+        for deleted_id in ids:
+            sources.update(_deleted_sources(deleted_id, None))
+        # 还没发出的消息查不到映射。非频道的消息 ID 在账号内唯一，
+        # 仍有排队任务的非频道源都可能是被删消息的来源
+        sources.update(
+            src
+            for src, dest in config.from_to.items()
+            if not _is_channel(src) and _pair_pending(src, dest)
+        )
+
+    for src in sources:
+        if src not in config.from_to:
+            continue
+
+        async def _delete(d: int, src: int = src) -> None:
+            mids = [mapping.get(src, i).get(d) for i in ids]
+            mids = [mid for mid in mids if mid]
+            if mids:
+                await _delete_batcher.add(event.client, d, mids)
+
+        def _forget(src: int = src) -> None:
+            for i in ids:
+                if mapping.get(src, i):
+                    mapping.pop(src, i)
+
+        await _fan_out(src, config.from_to[src], _delete, done=_forget)
+
+
+async def deleted_message_handler(event) -> None:
+    mapping = get_mapping()
+    # 频道删除时 Telegram 会给出 chat_id，否则只能按消息 ID 反查
+    chat_id = event.chat_id if event.chat_id in config.from_to else None
+    if event.chat_id is not None and chat_id is None:
+        return
+
+    if CONFIG.live.ordering == "pair":
+        await _delete_in_pair_order(event, chat_id)
+        return
+
+    per_dest: Dict[int, List[int]] = {}
+    for deleted_id in event.deleted_ids:
+        for src in _deleted_sources(deleted_id, chat_id):
+            if src not in config.from_to:
+                continue
+            for d, mid in mapping.pop(src, deleted_id).items():
+                per_dest.setdefault(d, []).append(mid)
+
+    for d, ids in per_dest.items():
+        await _delete_batcher.add(event.client, d, ids)
 
 
 ALL_EVENTS = {
@@ -172,6 +532,7 @@ async def start_sync() -> None:
         CONFIG.login.API_ID,
         CONFIG.login.API_HASH,
         sequential_updates=CONFIG.live.sequential_updates,
+        flood_sleep_threshold=const.FLOOD_SLEEP_THRESHOLD,
     )
 
     if CONFIG.login.user_type == 0:
@@ -188,15 +549,32 @@ async def start_sync() -> None:
     ALL_EVENTS.update(get_events())
     await config.load_admins(client)
     config.from_to = await config.load_from_to(client, CONFIG.forwards)
+    await warm_peer_cache(client, config.from_to)
+
+    if dispatcher is not None:
+        if CONFIG.live.sequential_updates and CONFIG.live.ordering == "none":
+            logging.warning("⚠️ worker 池下请用 ordering 保证顺序，sequential_updates 只约束入队")
+        dispatcher.start()
+    elif CONFIG.live.ordering != "none":
+        logging.warning("⚠️ ordering 需要 dispatch_workers > 0 才能生效")
 
-    for key, val in ALL_EVENTS.items():
+    for key, (handler, event_builder) in ALL_EVENTS.items():
         if not CONFIG.live.delete_sync and key == "deleted":
             continue
-        client.add_event_handler(*val)
+        if dispatcher is not None and key in DISPATCHED_EVENTS:
+            handler = dispatcher.wrap(handler, _ordering_key)
+        if key == "edited":
+            handler = edit_debouncer.wrap(handler, _edit_key)
+        client.add_event_handler(handler, event_builder)
         logging.info(f"✅ 注册事件处理器: {key}")
 
     if config.is_bot and const.REGISTER_COMMANDS:
         pass
 
     logging.info("🟢 live 模式启动完成")
-    await client.run_until_disconnected()
+    try:
+        await client.run_until_disconnected()
+    finally:
+        if dispatcher is not None:
+            await dispatcher.stop()
+        get_mapping().flush()
@@ -0,0 +1,281 @@
+"""源消息 → 目标消息 的 ID 映射存储。
+
+键为 (源 chat_id, 源 msg_id)，值为 {目标 chat_id: 目标 msg_id}。
+前面是一层内存 LRU 热缓存，后面是可插拔的持久化后端（默认 SQLite），
+写入先进入待写缓冲，按批次或时间间隔一次性落盘。
+"""
+
+import asyncio
+import atexit
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from tgcf.config import CONFIG
+
+Key = Tuple[int, int]
+Row = Tuple[int, int, int, int]
+
+
+class MappingBackend:
+    """持久化后端的接口。默认实现什么都不存，只依赖热缓存。"""
+
+    def get(self, chat_id: int, msg_id: int) -> Dict[int, int]:
+        return {}
+
+    def put_many(self, rows: List[Row]) -> None:
+        pass
+
+    def delete_many(self, keys: List[Key]) -> None:
+        pass
+
+    def chats_for(self, msg_id: int) -> List[int]:
+        """返回所有含有该源消息 ID 的源会话。"""
+        return []
+
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryBackend(MappingBackend):
+    """纯内存模式：映射只保存在热缓存里，重启后丢失。"""
+
+
+class SqliteBackend(MappingBackend):
+    """基于 SQLite 文件的映射后端。"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS mapping ("
+            " src_chat INTEGER NOT NULL,"
+            " src_msg INTEGER NOT NULL,"
+            " dest_chat INTEGER NOT NULL,"
+            " dest_msg INTEGER NOT NULL,"
+            " PRIMARY KEY (src_chat, src_msg, dest_chat)"
+            ") WITHOUT ROWID"
+        )
+        # 删除事件不一定带 chat_id，需要按源消息 ID 反查
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS mapping_src_msg ON mapping (src_msg)"
+        )
+        self.conn.commit()
+
+    def get(self, chat_id: int, msg_id: int) -> Dict[int, int]:
+        cur = self.conn.execute(
+            "SELECT dest_chat, dest_msg FROM mapping WHERE src_chat=? AND src_msg=?",
+            (chat_id, msg_id),
+        )
+        return dict(cur.fetchall())
+
+    def put_many(self, rows: List[Row]) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO mapping VALUES (?, ?, ?, ?)", rows
+        )
+
+    def delete_many(self, keys: List[Key]) -> None:
+        self.conn.executemany(
+            "DELETE FROM mapping WHERE src_chat=? AND src_msg=?", keys
+        )
+
+    def chats_for(self, msg_id: int) -> List[int]:
+        cur = self.conn.execute(
+            "SELECT DISTINCT src_chat FROM mapping WHERE src_msg=?", (msg_id,)
+        )
+        return [row[0] for row in cur.fetchall()]
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+
+class MappingStore:
+    """带 LRU 热缓存与批量写入的映射存储。"""
+
+    def __init__(
+        self,
+        backend: MappingBackend,
+        cache_size: int,
+        batch_size: int,
+        flush_interval: float,
+    ) -> None:
+        self.backend = backend
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._cache: "OrderedDict[Key, Dict[int, int]]" = OrderedDict()
+        self._pending: Dict[Key, Dict[int, int]] = {}
+        self._pending_deletes: set = set()
+        self._by_msg: Dict[int, Set[int]] = {}
+        self._pending_count = 0
+        self._last_flush = time.monotonic()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _remember(self, key: Key, value: Dict[int, int]) -> None:
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        self._by_msg.setdefault(key[1], set()).add(key[0])
+        while len(self._cache) > self.cache_size:
+            evicted, _ = self._cache.popitem(last=False)
+            self._forget(evicted)
+
+    def _forget(self, key: Key) -> None:
+        chats = self._by_msg.get(key[1])
+        if chats is not None:
+            chats.discard(key[0])
+            if not chats:
+                del self._by_msg[key[1]]
+
+    def get(self, chat_id: int, msg_id: int) -> Dict[int, int]:
+        """返回某条源消息在各目标中的消息 ID，不存在时返回空字典。"""
+        key = (chat_id, msg_id)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if key in self._pending_deletes:
+            value = {}
+        else:
+            value = self.backend.get(chat_id, msg_id)
+        value.update(self._pending.get(key, {}))
+        if value:
+            self._remember(key, value)
+        return value
+
+    def __contains__(self, key: Key) -> bool:
+        return bool(self.get(*key))
+
+    def set(self, chat_id: int, msg_id: int, dest: int, dest_msg_id: int) -> None:
+        """记录一条源消息在某个目标中的消息 ID。"""
+        key = (chat_id, msg_id)
+        value = self.get(chat_id, msg_id)
+        value[dest] = dest_msg_id
+        self._remember(key, value)
+        self._pending.setdefault(key, {})[dest] = dest_msg_id
+        self._pending_count += 1
+        self._maybe_flush()
+
+    def pop(self, chat_id: int, msg_id: int) -> Dict[int, int]:
+        """删除并返回某条源消息的映射。"""
+        key = (chat_id, msg_id)
+        value = self.get(chat_id, msg_id)
+        self._cache.pop(key, None)
+        self._forget(key)
+        self._pending.pop(key, None)
+        self._pending_deletes.add(key)
+        self._pending_count += 1
+        self._maybe_flush()
+        return value
+
+    def find(self, msg_id: int, chat_id: Optional[int] = None) -> List[int]:
+        """按源消息 ID 反查有映射的源会话；已知 chat_id 时直接命中。"""
+        if chat_id is not None:
+            return [chat_id] if self.get(chat_id, msg_id) else []
+        # 先落盘，保证后端与热缓存合起来是完整的
+        self.flush()
+        chats = set(self._by_msg.get(msg_id, ()))
+        chats.update(self.backend.chats_for(msg_id))
+        return [chat for chat in chats if (chat, msg_id) not in self._pending_deletes]
+
+    def _maybe_flush(self) -> None:
+        if (
+            self._pending_count >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+        elif self._timer is None:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        """写入之后没有新的写入时，也在 flush_interval 到期时落盘。"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中，由下一次写入或退出时落盘
+            return
+        delay = max(self._last_flush + self.flush_interval - time.monotonic(), 0)
+        self._timer = loop.call_later(delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self.flush()
+        if self._pending_count:
+            # 写入失败，下个间隔再试
+            self._schedule_flush()
+
+    def flush(self) -> None:
+        """把待写缓冲一次性写入后端。"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._last_flush = time.monotonic()
+        if not self._pending_count:
+            return
+        rows = [
+            (chat_id, msg_id, dest, dest_msg_id)
+            for (chat_id, msg_id), dests in self._pending.items()
+            for dest, dest_msg_id in dests.items()
+        ]
+        deletes = list(self._pending_deletes)
+        try:
+            if deletes:
+                self.backend.delete_many(deletes)
+            if rows:
+                self.backend.put_many(rows)
+            self.backend.commit()
+        except Exception as err:
+            logging.error(f"❌ 映射写入失败，保留在缓冲中稍后重试: {err}")
+            return
+        self._pending.clear()
+        self._pending_deletes.clear()
+        self._pending_count = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.backend.close()
+
+
+def msg_ids(result) -> List[Optional[int]]:
+    """把 send_message 的返回值统一转成消息 ID 列表。"""
+    if result is None:
+        return []
+    items: Iterable = result if isinstance(result, list) else [result]
+    return [getattr(item, "id", item) if item is not None else None for item in items]
+
+
+def _make_backend() -> MappingBackend:
+    settings = CONFIG.mapping
+    if settings.backend == "sqlite":
+        try:
+            return SqliteBackend(settings.path)
+        except sqlite3.Error as err:
+            logging.error(f"❌ 无法打开映射数据库 {settings.path}，改用内存模式: {err}")
+    return MemoryBackend()
+
+
+_store: Optional[MappingStore] = None
+
+
+def get_mapping() -> MappingStore:
+    global _store
+    if _store is None:
+        settings = CONFIG.mapping
+        _store = MappingStore(
+            _make_backend(),
+            cache_size=settings.cache_size,
+            batch_size=settings.batch_size,
+            flush_interval=settings.flush_interval,
+        )
+        atexit.register(_store.close)
+        logging.info(f"🗂️ 消息映射存储: {settings.backend}")
+    return _store
@@ -0,0 +1,94 @@
+"""插件共用的媒体下载缓存。
+
+同一条消息的媒体在一个进程里只下载一次：各插件通过 TgcfMessage
+拿到同一份下载，按引用计数管理，最后一个持有者（所有插件与所有目标
+发送完成后的 TgcfMessage.clear）释放时才删除文件。不超过
+media.memory_limit 的文件可以直接下载到内存，供只需要字节的插件使用。
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from telethon.tl.custom.message import Message
+
+from tgcf.config import CONFIG
+from tgcf.utils import cleanup, stamp
+
+Key = Tuple[int, int]
+
+
+class Download:
+    """一条消息的共享下载。"""
+
+    __slots__ = ("key", "message", "refs", "lock", "path", "data")
+
+    def __init__(self, key: Key, message: Message) -> None:
+        self.key = key
+        self.message = message
+        self.refs = 0
+        self.lock = asyncio.Lock()
+        self.path: Optional[str] = None
+        self.data: Optional[bytes] = None
+
+    @property
+    def size(self) -> int:
+        file = self.message.file
+        return (file.size or 0) if file else 0
+
+    async def get_path(self) -> str:
+        async with self.lock:
+            if self.path is None:
+                self.path = stamp(
+                    await self.message.download_media(""), self.message.sender_id
+                )
+                logging.info(f"📥 已下载 {self.key} → {self.path}")
+            return self.path
+
+    async def get_bytes(self, memory_limit: int) -> bytes:
+        async with self.lock:
+            if self.data is not None:
+                return self.data
+            if self.path is None and 0 < self.size <= memory_limit:
+                self.data = await self.message.download_media(bytes)
+                logging.info(f"📥 已下载到内存 {self.key} ({self.size} B)")
+                return self.data
+        path = await self.get_path()
+        with open(path, "rb") as file:
+            return file.read()
+
+
+class MediaCache:
+    """按 (chat_id, msg_id) 共享下载，引用计数归零时删除文件。"""
+
+    def __init__(self, memory_limit: int) -> None:
+        self.memory_limit = memory_limit
+        self.downloads: Dict[Key, Download] = {}
+
+    def acquire(self, message: Message) -> Download:
+        key = (message.chat_id, message.id)
+        download = self.downloads.get(key)
+        if download is None:
+            download = self.downloads[key] = Download(key, message)
+        download.refs += 1
+        return download
+
+    def release(self, download: Download) -> None:
+        download.refs -= 1
+        if download.refs > 0:
+            return
+        if self.downloads.get(download.key) is download:
+            del self.downloads[download.key]
+        if download.path is not None:
+            cleanup(download.path)
+        download.data = None
+
+
+_cache: Optional[MediaCache] = None
+
+
+def get_media_cache() -> MediaCache:
+    global _cache
+    if _cache is None:
+        _cache = MediaCache(CONFIG.media.memory_limit)
+    return _cache
@@ -0,0 +1,157 @@
+"""past 模式的自适应发送节奏（AIMD）。
+
+每个目标会话各有一个发送速率：从 past.delay 对应的速率起步，
+每次成功发送加性提升，直到该会话在限流器里的默认速率；
+限流器上报 FloodWait 时乘性下降，并在等待结束前不再发送。
+节奏按目标共享，多个并发的连接发往同一目标时依次领取发送时间。
+各连接的进度、速率与预计剩余时间由 Progress 给出。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from tgcf.config import CONFIG
+from tgcf.ratelimit import get_limiter
+
+# 每次成功后提升 上限速率 × RAMP_UP，FloodWait 后乘以 BACK_OFF
+RAMP_UP = 0.05
+BACK_OFF = 0.5
+
+
+class _Pace:
+    __slots__ = ("rate", "ceiling", "next_send", "sent", "flood_waits")
+
+    def __init__(self, rate: float, ceiling: float) -> None:
+        self.rate = rate
+        self.ceiling = ceiling
+        self.next_send = 0.0
+        self.sent = 0
+        self.flood_waits = 0
+
+
+class Pacer:
+    """按目标会话控制 past 模式的发送间隔。"""
+
+    def __init__(self, delay: float, max_delay: float, adaptive: bool) -> None:
+        self.delay = delay
+        self.floor = 1 / max(max_delay, delay, 1)
+        self.adaptive = adaptive
+        self.paces: Dict[int, _Pace] = {}
+        get_limiter().flood_listeners.append(self.on_flood_wait)
+
+    def _pace(self, dest: int) -> _Pace:
+        pace = self.paces.get(dest)
+        if pace is None:
+            # 限流器为该会话设定的默认速率就是能达到的上限
+            ceiling = get_limiter().default_rate(dest)
+            if not self.adaptive and self.delay:
+                ceiling = min(ceiling, 1 / self.delay)
+            rate = min(ceiling, 1 / self.delay) if self.delay else ceiling
+            pace = self.paces[dest] = _Pace(max(rate, self.floor), ceiling)
+        return pace
+
+    async def wait(self, dest: int) -> None:
+        """领取向 dest 发送下一条的时间，并等到那一刻。"""
+        pace = self._pace(dest)
+        now = time.monotonic()
+        slot = max(now, pace.next_send)
+        pace.next_send = slot + 1 / pace.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def on_success(self, dest: int) -> None:
+        pace = self._pace(dest)
+        pace.sent += 1
+        if self.adaptive:
+            pace.rate = min(pace.ceiling, pace.rate + pace.ceiling * RAMP_UP)
+
+    def on_flood_wait(self, dest: int, seconds: float) -> None:
+        pace = self.paces.get(dest)
+        if pace is None:
+            return
+        pace.flood_waits += 1
+        pace.rate = max(self.floor, pace.rate * BACK_OFF)
+        pace.next_send = max(pace.next_send, time.monotonic() + seconds)
+        logging.info(f"🐢 {dest} 放慢到 {pace.rate * 60:.1f} 条/分")
+
+    def rate(self, dests: List[int]) -> float:
+        """这些目标中最慢者的当前速率（条/秒），决定一个连接的进度。"""
+        rates = [self.paces[d].rate for d in dests if d in self.paces]
+        if not rates:
+            return 1 / self.delay if self.delay else 0.0
+        return min(rates)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            str(dest): {
+                "per_minute": round(pace.rate * 60, 2),
+                "ceiling_per_minute": round(pace.ceiling * 60, 2),
+                "sent": pace.sent,
+                "flood_waits": pace.flood_waits,
+            }
+            for dest, pace in self.paces.items()
+        }
+
+    def close(self) -> None:
+        listeners = get_limiter().flood_listeners
+        if self.on_flood_wait in listeners:
+            listeners.remove(self.on_flood_wait)
+
+
+class Progress:
+    """一个连接的回填进度。"""
+
+    def __init__(self, src: int, dests: List[int], end: int, interval: float) -> None:
+        self.src = src
+        self.dests = dests
+        self.end = end
+        self.interval = interval
+        self.started = time.monotonic()
+        self.reported = self.started
+        self.done = 0
+
+    def throughput(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self, remaining: int) -> Optional[float]:
+        """按实测吞吐与目标当前速率中较慢者估算剩余秒数。"""
+        rates = [r for r in (self.throughput(), get_pacer().rate(self.dests)) if r > 0]
+        if not rates:
+            return None
+        return remaining / min(rates)
+
+    def advance(self, current: int, count: int = 1) -> None:
+        """记录处理完的源消息，每隔 interval 秒输出一次进度。"""
+        self.done += count
+        now = time.monotonic()
+        if now - self.reported < self.interval:
+            return
+        self.reported = now
+        remaining = max(self.end - current, 0)
+        logging.info(
+            f"📊 {self.src}: {current}/{self.end}，"
+            f"{self.throughput() * 60:.1f} 条/分，"
+            f"预计剩余 {format_eta(self.eta(remaining))}"
+        )
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "未知"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+
+
+_pacer: Optional[Pacer] = None
+
+
+def get_pacer() -> Pacer:
+    global _pacer
+    if _pacer is None:
+        settings = CONFIG.past
+        _pacer = Pacer(settings.delay, settings.max_delay, settings.adaptive)
+    return _pacer
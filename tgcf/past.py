@@ -2,9 +2,7 @@
 
 import asyncio
 import logging
-import random
-from collections import defaultdict
-from typing import List, Dict, Optional
+from typing import List, Tuple
 
 from telethon import TelegramClient
 from telethon.errors.rpcerrorlist import FloodWaitError
@@ -12,24 +10,133 @@ from telethon.tl.custom.message import Message
 from telethon.tl.patched import MessageService
 
 from tgcf import config
-from tgcf import storage as st
-from tgcf.config import CONFIG, get_SESSION, write_config
-from tgcf.plugins import apply_plugins, apply_plugins_to_group, load_async_plugins
-from tgcf.utils import clean_session_files, send_message
+from tgcf.checkpoint import get_checkpoints
+from tgcf.config import CONFIG, Forward, get_SESSION, write_config
+from tgcf.const import FLOOD_SLEEP_THRESHOLD, MAX_IDS_PER_REQUEST
+from tgcf.mapping import get_mapping, msg_ids
+from tgcf.pacing import Progress, get_pacer
+from tgcf.plugins import (
+    TgcfMessage,
+    apply_plugins,
+    apply_plugins_to_group,
+    load_async_plugins,
+)
+from tgcf.utils import (
+    call_limited,
+    clean_session_files,
+    forward_copies,
+    send_message,
+    server_copy_captions,
+    warm_peer_cache,
+)
+
+# 进度日志的最小间隔（秒）
+PROGRESS_INTERVAL = 60
+
+# 单条消息，或一整个媒体组
+Unit = List[Message]
+
+
+def _batchable(tms: List[TgcfMessage]) -> bool:
+    """能否并入批量转发：不是回复，且显示转发来源或插件没有改动内容。"""
+    if not tms or any(tm.message.is_reply for tm in tms):
+        return False
+    if CONFIG.show_forwarded_from:
+        return True
+    # 需要 drop_media_captions 的消息不能和普通消息合并成一次转发
+    return CONFIG.server_copy and server_copy_captions(tms) is False
+
+
+class BatchForwardError(Exception):
+    """批次没能转发到所有目标。offset 停在批次之前，由调用方中止该连接。"""
+
+
+class ForwardBatch:
+    """连续的可批量消息，每个目标一次 ForwardMessages 请求。
+
+    攒满 MAX_IDS_PER_REQUEST 条、遇到不能批量的消息或回填结束时发送；
+    媒体组总是整组加入同一批。映射在每个目标发送后更新，offset 只在
+    所有目标都成功后更新。
+    """
+
+    def __init__(
+        self,
+        client: TelegramClient,
+        src: int,
+        dest: List[int],
+        forward: Forward,
+        progress: Progress,
+    ) -> None:
+        self.client = client
+        self.src = src
+        self.dest = dest
+        self.forward = forward
+        self.progress = progress
+        self.tms: List[TgcfMessage] = []
+
+    async def add(self, tms: List[TgcfMessage]) -> None:
+        if len(self.tms) + len(tms) > MAX_IDS_PER_REQUEST:
+            await self.flush()
+        self.tms.extend(tms)
+        if len(self.tms) >= MAX_IDS_PER_REQUEST:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self.tms:
+            return
+        tms, self.tms = self.tms, []
+        messages = [tm.message for tm in tms]
+        drop_author = not CONFIG.show_forwarded_from
+        mapping = get_mapping()
+        pacer = get_pacer()
+        failed = []
+
+        try:
+            for d in self.dest:
+                # 中断后重新回填时，已转发到该目标的消息不再重复发送
+                pending = [m for m in messages if d not in mapping.get(self.src, m.id)]
+                if not pending:
+                    continue
+                await pacer.wait(d)
+                try:
+                    fwded_msgs = await call_limited(
+                        self.client,
+                        d,
+                        lambda: forward_copies(self.client, d, pending, drop_author),
+                        "批量转发",
+                    )
+                except Exception as e:
+                    logging.error(f"❌ 批量转发到 {d} 失败 ({len(pending)} 条): {e}")
+                    failed.append(d)
+                    continue
+                for original_msg, fwded_id in zip(pending, msg_ids(fwded_msgs)):
+                    if fwded_id is not None:
+                        mapping.set(self.src, original_msg.id, d, fwded_id)
+                pacer.on_success(d)
+        finally:
+            for tm in tms:
+                tm.clear()
+
+        if failed:
+            raise BatchForwardError(
+                f"批量转发到 {failed} 失败，offset 保持在 {self.forward.offset}"
+            )
+        last_id = max(m.id for m in messages)
+        get_checkpoints().record(self.forward, last_id)
+        logging.info(f"📦 批量转发 {len(messages)} 条完成, offset → {last_id}")
+        self.progress.advance(last_id, len(messages))
 
 
 async def _send_past_grouped(
-    client: TelegramClient, src: int, dest: List[int], messages: List[Message]
+    client: TelegramClient, src: int, dest: List[int], tms: List[TgcfMessage]
 ) -> bool:
     """强制发送整组消息"""
-    tms = await apply_plugins_to_group(messages)
-    if not tms:
-        logging.warning("⚠️ 所有消息被插件过滤，但仍尝试发送空相册...")
-        tms = [await apply_plugins(messages[0])]
-
     tm_template = tms[0]
+    mapping = get_mapping()
+    pacer = get_pacer()
 
     for d in dest:
+        await pacer.wait(d)
         try:
             fwded_msgs = await send_message(
                 d,
@@ -38,51 +145,273 @@ async def _send_past_grouped(
                 grouped_tms=tms
             )
 
-            first_msg_id = messages[0].id
-            event_uid = st.EventUid(st.DummyEvent(src, first_msg_id))
-            st.stored[event_uid] = {d: fwded_msgs}
+            for tm, fwded_id in zip(tms, msg_ids(fwded_msgs)):
+                if fwded_id is not None:
+                    mapping.set(src, tm.message.id, d, fwded_id)
+            pacer.on_success(d)
 
         except Exception as e:
             logging.critical(f"🚨 组播失败但将继续重试（不中断）: {e}")
 
+    for tm in tms:
+        tm.clear()
     return True
 
 
-async def _flush_grouped_buffer(
+async def _send_unit(
     client: TelegramClient,
     src: int,
     dest: List[int],
-    grouped_buffer: Dict[int, List[Message]],
-    forward,
-) -> int:
+    forward: Forward,
+    progress: Progress,
+    batch: ForwardBatch,
+    unit: Unit,
+    tms: List[TgcfMessage],
+) -> None:
+    """发送一个单元：可批量的并入 batch，其余逐条（逐组）发送并更新 offset。"""
+    if not tms:
+        return
+    if _batchable(tms):
+        await batch.add(tms)
+        return
+    # 回复要用到之前消息的映射，先把积攒的批次发出去
+    await batch.flush()
+
+    if unit[0].grouped_id is not None:
+        await _send_past_grouped(client, src, dest, tms)
+        # 取组内最大消息 ID 作为 offset
+        last_id = max(m.id for m in unit)
+        get_checkpoints().record(forward, last_id)
+        logging.info(
+            f"✅ 媒体组 {unit[0].grouped_id} ({len(unit)} 条) 发送完成, offset → {last_id}"
+        )
+        progress.advance(last_id, len(unit))
+        return
+
+    tm = tms[0]
+    message = unit[0]
+    mapping = get_mapping()
+    pacer = get_pacer()
+    replied = (
+        mapping.get(src, message.reply_to_msg_id)
+        if message.is_reply
+        else {}
+    )
+
+    for d in dest:
+        tm.reply_to = replied.get(d)
+        await pacer.wait(d)
+        try:
+            fwded_ids = msg_ids(await send_message(d, tm))
+            if fwded_ids and fwded_ids[0] is not None:
+                mapping.set(src, message.id, d, fwded_ids[0])
+            pacer.on_success(d)
+        except Exception as e:
+            logging.error(f"❌ 单条发送失败: {e}")
+
+    tm.clear()
+    get_checkpoints().record(forward, message.id)
+    progress.advance(message.id)
+
+
+async def _iter_history(client: TelegramClient, src: int, offset: int):
+    """按 ID 升序读取历史；FloodWait 时等待后从最后读到的消息继续。
+
+    客户端的 flood_sleep_threshold 为 0，读取历史的 FloodWait 也会抛出。
     """
-    刷新所有已缓存的媒体组，逐组发送并在每组之间 sleep。
-    返回最后处理的消息 ID（用于更新 offset）。
+    while True:
+        try:
+            async for message in client.iter_messages(
+                src, reverse=True, offset_id=offset
+            ):
+                offset = message.id
+                yield message
+            return
+        except FloodWaitError as fwe:
+            logging.warning(f"⛔ FloodWait (读取 {src} 历史): 等待 {fwe.seconds} 秒")
+            await asyncio.sleep(fwe.seconds)
+
+
+async def _latest_id(client: TelegramClient, src: int) -> int:
+    while True:
+        try:
+            latest = await client.get_messages(src, limit=1)
+            return latest[0].id if latest else 0
+        except FloodWaitError as fwe:
+            logging.warning(f"⛔ FloodWait (读取 {src} 历史): 等待 {fwe.seconds} 秒")
+            await asyncio.sleep(fwe.seconds)
+
+
+async def _prefetch(
+    client: TelegramClient,
+    src: int,
+    forward: Forward,
+    units: asyncio.Queue,
+    work: asyncio.Queue,
+) -> None:
+    """按顺序读取历史，把单条消息与完整的媒体组依次放进流水线。
+
+    units 有界：发送端落后 lookahead 个单元时这里暂停读取。
     """
-    last_id = 0
-    for gid, msgs in list(grouped_buffer.items()):
-        if not msgs:
-            continue
+    loop = asyncio.get_running_loop()
+    album: Unit = []
+
+    async def emit(unit: Unit) -> None:
+        future = loop.create_future()
+        await units.put((unit, future))
+        work.put_nowait((unit, future))
+
+    try:
+        async for message in _iter_history(client, src, forward.offset):
+            if isinstance(message, MessageService):
+                continue
+            if forward.end and message.id > forward.end:
+                # 按 ID 升序读取，之后的消息都超出范围
+                break
+            # 媒体组的消息是连续的，grouped_id 变化即是组边界
+            if album and message.grouped_id != album[0].grouped_id:
+                await emit(album)
+                album = []
+            if message.grouped_id is not None:
+                album.append(message)
+            else:
+                await emit([message])
+        if album:
+            await emit(album)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        # 让发送端先发完已取到的消息，异常由 _forward_connection 再抛出
+        await units.put(None)
+        raise
+    await units.put(None)
+
+
+async def _transform(unit: Unit) -> List[TgcfMessage]:
+    if unit[0].grouped_id is None:
+        tm = await apply_plugins(unit[0])
+        return [tm] if tm else []
+    tms = await apply_plugins_to_group(unit)
+    if not tms:
+        logging.warning("⚠️ 所有消息被插件过滤，但仍尝试发送空相册...")
+        tm = await apply_plugins(unit[0])
+        tms = [tm] if tm else []
+    return tms
 
-        await _send_past_grouped(client, src, dest, msgs)
 
-        # 取组内最大消息 ID 作为 offset
-        group_last_id = max(m.id for m in msgs)
-        last_id = max(last_id, group_last_id)
+async def _transform_worker(work: asyncio.Queue) -> None:
+    """执行插件（包括下载、水印、OCR），结果交给对应单元的 future。"""
+    while True:
+        unit, future = await work.get()
+        try:
+            tms = await _transform(unit)
+        except Exception as e:
+            if not future.cancelled():
+                future.set_exception(e)
+        else:
+            if future.cancelled():
+                # 发送端已经停止，没有人会再发送并释放这些消息
+                for tm in tms:
+                    tm.clear()
+            else:
+                future.set_result(tms)
 
-        # 更新 offset
-        forward.offset = group_last_id
-        write_config(CONFIG, persist=False)
 
-        logging.info(f"✅ 媒体组 {gid} ({len(msgs)} 条) 发送完成, offset → {group_last_id}")
+def _abandon(units: asyncio.Queue) -> None:
+    """连接中止时释放已处理完但不会再发送的消息。"""
+    while not units.empty():
+        item = units.get_nowait()
+        if item is None:
+            continue
+        _, future = item
+        if future.done() and not future.cancelled() and not future.exception():
+            for tm in future.result():
+                tm.clear()
+        future.cancel()
 
-        # 每组之间也要延迟，防止 FloodWait
-        delay_seconds = random.randint(60, 300)
-        logging.info(f"⏸️ 媒体组发送后休息 {delay_seconds} 秒")
-        await asyncio.sleep(delay_seconds)
 
-    grouped_buffer.clear()
-    return last_id
+async def _forward_connection(
+    client: TelegramClient, src: int, dest: List[int], forward: Forward
+) -> None:
+    """回填一个连接的历史消息，offset 记录在该连接自己的 forward 上。
+
+    读取、插件处理、发送三段流水线并行：发送端在等待节奏时，
+    后面的消息已经在下载和处理。发送严格按历史顺序进行。
+    """
+    end = forward.end
+    if not end:
+        end = await _latest_id(client, src)
+    progress = Progress(src, dest, end, PROGRESS_INTERVAL)
+    batch = ForwardBatch(client, src, dest, forward, progress)
+    logging.info(f"🔗 开始回填 {src} → {dest}，从 {forward.offset} 到 {end}")
+
+    # 按顺序排队的 (单元, 插件结果)，队列长度限制了预取与处理的提前量
+    units: asyncio.Queue = asyncio.Queue(CONFIG.past.lookahead)
+    work: asyncio.Queue = asyncio.Queue()
+    prefetcher = asyncio.ensure_future(_prefetch(client, src, forward, units, work))
+    workers = [
+        asyncio.ensure_future(_transform_worker(work))
+        for _ in range(CONFIG.past.workers)
+    ]
+
+    try:
+        while True:
+            item = await units.get()
+            if item is None:
+                break
+            unit, future = item
+            try:
+                tms = await future
+            except Exception as err:
+                logging.exception(err)
+                continue
+            try:
+                await _send_unit(
+                    client, src, dest, forward, progress, batch, unit, tms
+                )
+            except FloodWaitError as fwe:
+                logging.warning(f"⛔ FloodWait: 等待 {fwe.seconds} 秒")
+                await asyncio.sleep(fwe.seconds)
+            except BatchForwardError:
+                # 继续发送后面的消息会让 offset 越过这一批
+                for tm in tms:
+                    tm.clear()
+                raise
+            except Exception as err:
+                logging.exception(err)
+
+        await batch.flush()
+        # 读取历史时的异常在这里抛出
+        await prefetcher
+    finally:
+        for task in [prefetcher, *workers]:
+            task.cancel()
+        await asyncio.gather(prefetcher, *workers, return_exceptions=True)
+        _abandon(units)
+        for tm in batch.tms:
+            tm.clear()
+
+    logging.info(f"🏁 {src} 回填完成，共 {progress.done} 条")
+
+
+async def _connections(
+    client: TelegramClient, forwards: List[Forward]
+) -> List[Tuple[Forward, int, List[int]]]:
+    """逐个解析连接的源与目标（与 CONFIG.forwards 一一对应，不依赖字典顺序）。"""
+    connections = []
+    for forward in forwards:
+        if not forward.use_this:
+            continue
+        if not isinstance(forward.source, int) and forward.source.strip() == "":
+            continue
+        try:
+            src = await config.get_id(client, forward.source)
+            dest = [await config.get_id(client, d) for d in forward.dest]
+        except Exception as e:
+            logging.error(f"❌ 无法解析连接 {forward.con_name or forward.source}: {e}")
+            continue
+        connections.append((forward, src, dest))
+    return connections
 
 
 async def forward_job() -> None:
@@ -94,99 +423,38 @@ async def forward_job() -> None:
         return
 
     SESSION = get_SESSION()
-    async with TelegramClient(SESSION, CONFIG.login.API_ID, CONFIG.login.API_HASH) as client:
+    async with TelegramClient(
+        SESSION,
+        CONFIG.login.API_ID,
+        CONFIG.login.API_HASH,
+        flood_sleep_threshold=FLOOD_SLEEP_THRESHOLD,
+    ) as client:
         config.from_to = await config.load_from_to(client, CONFIG.forwards)
+        await warm_peer_cache(client, config.from_to)
+        connections = await _connections(client, CONFIG.forwards)
+        checkpoints = get_checkpoints()
+        for forward, _, _ in connections:
+            checkpoints.resume(forward)
 
-        for from_to, forward in zip(config.from_to.items(), CONFIG.forwards):
-            src, dest = from_to
-            last_id = 0
-            grouped_buffer: Dict[int, List[Message]] = defaultdict(list)
-            # 记录上一条消息的 grouped_id，用于检测组边界
-            prev_grouped_id: Optional[int] = None
+        # 连接之间并发；发往同一目标的连接共享该目标的节奏与限流
+        slots = asyncio.Semaphore(CONFIG.past.parallelism)
 
-            async for message in client.iter_messages(src, reverse=True, offset_id=forward.offset):
-                if isinstance(message, MessageService):
-                    continue
+        async def run(forward: Forward, src: int, dest: List[int]) -> None:
+            async with slots:
+                try:
+                    await _forward_connection(client, src, dest, forward)
+                except Exception as e:
+                    logging.exception(f"🚨 连接 {src} 回填中断: {e}")
 
-                if forward.end and message.id > forward.end:
-                    continue
+        await asyncio.gather(*(run(*connection) for connection in connections))
 
-                try:
-                    current_grouped_id = message.grouped_id
-
-                    # ── 检测组边界：当前消息不属于之前缓存的组 ──
-                    # 情况1: 上一条是组消息，当前是单条消息 → 刷新
-                    # 情况2: 上一条是组A，当前是组B → 刷新组A
-                    # 情况3: 上一条是组消息，当前也是同组 → 继续缓存
-                    if grouped_buffer and (
-                        current_grouped_id is None  # 单条消息，刷新之前的组
-                        or (current_grouped_id is not None
-                            and current_grouped_id not in grouped_buffer)  # 新的组，刷新之前的
-                    ):
-                        try:
-                            flushed_last = await _flush_grouped_buffer(
-                                client, src, dest, grouped_buffer, forward
-                            )
-                            if flushed_last:
-                                last_id = max(last_id, flushed_last)
-                        except FloodWaitError as fwe:
-                            logging.warning(f"⛔ FloodWait (组刷新): 等待 {fwe.seconds} 秒")
-                            await asyncio.sleep(fwe.seconds)
-                            # 重试刷新
-                            flushed_last = await _flush_grouped_buffer(
-                                client, src, dest, grouped_buffer, forward
-                            )
-                            if flushed_last:
-                                last_id = max(last_id, flushed_last)
-
-                    # ── 当前消息是媒体组的一部分 → 缓存 ──
-                    if current_grouped_id is not None:
-                        grouped_buffer[current_grouped_id].append(message)
-                        prev_grouped_id = current_grouped_id
-                        continue
-
-                    # ── 处理单条消息 ──
-                    prev_grouped_id = None
-
-                    tm = await apply_plugins(message)
-                    if not tm:
-                        continue
-
-                    event_uid = st.EventUid(st.DummyEvent(message.chat_id, message.id))
-                    st.stored[event_uid] = {}
-
-                    if message.is_reply:
-                        r_event = st.DummyEvent(message.chat_id, message.reply_to_msg_id)
-                        r_event_uid = st.EventUid(r_event)
-                        if r_event_uid in st.stored:
-                            tm.reply_to = st.stored[r_event_uid].get(dest[0])
-
-                    for d in dest:
-                        try:
-                            fwded_msg = await send_message(d, tm)
-                            st.stored[event_uid][d] = fwded_msg.id
-                        except Exception as e:
-                            logging.error(f"❌ 单条发送失败: {e}")
+        logging.info(f"🏁 past 模式完成: {get_pacer().snapshot()}")
+        get_mapping().flush()
 
-                    tm.clear()
-                    last_id = message.id
-                    forward.offset = last_id
-                    write_config(CONFIG, persist=False)
-
-                    delay_seconds = random.randint(60, 300)
-                    logging.info(f"⏸️ 休息 {delay_seconds} 秒 (单条消息 {message.id})")
-                    await asyncio.sleep(delay_seconds)
-
-                except FloodWaitError as fwe:
-                    logging.warning(f"⛔ FloodWait: 等待 {fwe.seconds} 秒")
-                    await asyncio.sleep(fwe.seconds)
-                except Exception as err:
-                    logging.exception(err)
-
-            # ── 循环结束后，刷新剩余的媒体组 ──
-            if grouped_buffer:
-                logging.info(f"📦 刷新剩余 {len(grouped_buffer)} 个媒体组")
-                try:
-                    await _flush_grouped_buffer(client, src, dest, grouped_buffer, forward)
-                except Exception as e:
-                    logging.exception(f"🚨 刷新剩余组失败: {e}")
+        # offset 写回配置（文件或 Mongo）之后，检查点日志就不再需要了
+        try:
+            write_config(CONFIG)
+        except Exception as e:
+            logging.error(f"❌ 保存 offset 失败，保留检查点日志: {e}")
+        else:
+            checkpoints.clear()
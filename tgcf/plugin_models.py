@@ -63,10 +63,16 @@ class MarkConfig(BaseModel):
     image: str = "image.png"
     position: Position = Position.centre
     frame_rate: int = 15
+    workers: int = 0  # 0: one job per CPU core
+    max_video_size: int = 0  # MB, 0: no limit
+    max_video_duration: int = 0  # seconds, 0: no limit
 
 
 class OcrConfig(BaseModel):
     check: bool = False
+    workers: int = 0  # 0: one process per CPU core
+    timeout: float = 60
+    max_queue: int = 32
 
 
 class Replace(BaseModel):
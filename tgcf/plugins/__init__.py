@@ -4,33 +4,63 @@
 
 import inspect
 import logging
-from typing import Any, Dict, List, Union
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from telethon.tl.custom.message import Message
 
 from tgcf.config import CONFIG
+from tgcf.media import Download, get_media_cache
 from tgcf.plugin_models import ASYNC_PLUGIN_IDS
-from tgcf.utils import cleanup, stamp
+from tgcf.utils import UploadOnce, cleanup
 
 
 class TgcfMessage:
     def __init__(self, message: Message) -> None:
         self.message = message
         self.text = self.message.text or ""
+        # 插件处理前的文字，用来判断 text 是否被改动过
+        self.original_text = self.text
         self.raw_text = self.message.raw_text or ""
         self.sender_id = self.message.sender_id
         self.file_type = self.guess_file_type()
         self.new_file = None
         self.cleanup = False
+        self.file = None
+        # 与其他插件、其他 TgcfMessage 共享的下载，clear 时释放
+        self._download: Optional[Download] = None
         self.reply_to = None
         self.client = self.message.client
+        # 浅拷贝（按目标设置 reply_to）时共享，保证新文件只上传一次
+        self.uploaded = UploadOnce()
 
-    async def get_file(self) -> str:
+    def _shared_download(self) -> Download:
         if self.file_type == "nofile":
             raise FileNotFoundError("No file exists in this message.")
-        self.file = stamp(await self.message.download_media(""), self.sender_id)
+        if self._download is None:
+            self._download = get_media_cache().acquire(self.message)
+        return self._download
+
+    async def get_file(self) -> str:
+        """下载到本地文件（同一条消息只下载一次），返回路径。"""
+        self.file = await self._shared_download().get_path()
         return self.file
 
+    async def get_bytes(self) -> bytes:
+        """取媒体的字节内容，小文件直接下载到内存。"""
+        return await self._shared_download().get_bytes(
+            get_media_cache().memory_limit
+        )
+
     def guess_file_type(self) -> str:
         for ft in ["photo", "video", "gif", "audio", "document", "sticker", "contact"]:
             if getattr(self.message, ft, None):
@@ -39,12 +69,35 @@ class TgcfMessage:
 
     def clear(self) -> None:
         if self.new_file and self.cleanup:
-            cleanup(self.new_file)
+            if isinstance(self.new_file, str):
+                cleanup(self.new_file)
+            else:
+                # 内存中的文件（如 Pillow 生成的图片）
+                self.new_file.close()
             self.new_file = None
+        if self._download is not None:
+            get_media_cache().release(self._download)
+            self._download = None
+
+
+# 插件的成本等级，调度时便宜的先执行
+COST_TEXT = 0  # 只处理文字
+COST_DOWNLOAD = 1  # 需要下载媒体
+COST_CPU = 2  # 下载后还要做耗 CPU 的处理
 
 
 class TgcfPlugin:
     id_ = "plugin"
+    # 只产出新媒体、不影响文字的插件在编辑同步时会被跳过
+    edits_media = False
+    cost = COST_TEXT
+    # 可能丢弃消息的插件尽量提前执行
+    rejects = False
+    # 读写的 TgcfMessage 字段，用于判断两个插件能否交换顺序
+    reads: FrozenSet[str] = frozenset()
+    writes: FrozenSet[str] = frozenset()
+    # 必须排在这些插件之后（它们启用时）
+    depends: Tuple[str, ...] = ()
 
     def __init__(self, data: Dict[str, Any]) -> None:
         self.data = data
@@ -60,18 +113,92 @@ class TgcfPlugin:
 
 
 PLUGINS = CONFIG.plugins
+# 历史上的固定执行顺序；调度时读写冲突的插件仍保持这个先后
+PLUGIN_ORDER = ["filter", "ocr", "replace", "caption", "fmt", "mark"]
+
 _plugins = {}
+# 编译好的执行链：(插件, modify 是否为协程, 处理媒体组的协程函数)
+GroupCall = Callable[[List[TgcfMessage]], Awaitable[List[TgcfMessage]]]
+Stage = Tuple[TgcfPlugin, bool, GroupCall]
+_chain: List[Stage] = []
+_text_chain: List[Stage] = []
+
+
+def _must_precede(a: TgcfPlugin, b: TgcfPlugin) -> bool:
+    """a 原本在 b 之前时，两者读写了同一字段就不能交换。"""
+    return bool(a.writes & (b.reads | b.writes) or a.reads & b.writes)
+
+
+def schedule(plugins: Dict[str, TgcfPlugin]) -> List[str]:
+    """按依赖做拓扑排序，就绪的插件中先执行便宜且可能丢弃消息的。"""
+    ids = [pid for pid in PLUGIN_ORDER if pid in plugins]
+    ids += [pid for pid in plugins if pid not in ids]
+    preds = {pid: set() for pid in ids}
+    for i, a in enumerate(ids):
+        for b in ids[i + 1 :]:
+            if _must_precede(plugins[a], plugins[b]):
+                preds[b].add(a)
+    for pid in ids:
+        preds[pid].update(dep for dep in plugins[pid].depends if dep in preds)
+
+    order = []
+    while preds:
+        ready = [pid for pid, deps in preds.items() if not deps]
+        if not ready:
+            logging.error(f"❌ 插件依赖存在环，按原顺序执行: {list(preds)}")
+            order += [pid for pid in ids if pid in preds]
+            break
+        pid = min(
+            ready,
+            key=lambda p: (plugins[p].cost, not plugins[p].rejects, ids.index(p)),
+        )
+        order.append(pid)
+        del preds[pid]
+        for deps in preds.values():
+            deps.discard(pid)
+    return order
+
+
+def _group_call(plugin: TgcfPlugin) -> GroupCall:
+    if inspect.iscoroutinefunction(plugin.modify_group):
+        return plugin.modify_group
+
+    if type(plugin).modify_group is TgcfPlugin.modify_group and (
+        inspect.iscoroutinefunction(plugin.modify)
+    ):
+        # 默认的 modify_group 是同步的，异步插件逐条 await
+        async def modify_each(tms: List[TgcfMessage]) -> List[TgcfMessage]:
+            return [await plugin.modify(tm) for tm in tms if tm]
+
+        return modify_each
+
+    async def modify_group(tms: List[TgcfMessage]) -> List[TgcfMessage]:
+        return plugin.modify_group(tms)
+
+    return modify_group
+
+
+def compile_chain(plugins: Dict[str, TgcfPlugin]) -> None:
+    """加载时确定执行顺序，并缓存每个插件的方法是否为协程。"""
+    global _chain, _text_chain
+    _chain = [
+        (
+            plugins[pid],
+            inspect.iscoroutinefunction(plugins[pid].modify),
+            _group_call(plugins[pid]),
+        )
+        for pid in schedule(plugins)
+    ]
+    _text_chain = [stage for stage in _chain if not stage[0].edits_media]
+    if _chain:
+        logging.info(f"🔗 插件执行顺序: {[stage[0].id_ for stage in _chain]}")
 
 
 def load_plugins() -> Dict[str, TgcfPlugin]:
     global _plugins
     _plugins = {}
 
-    plugin_order = [
-        "filter", "ocr", "replace", "caption", "fmt", "mark"
-    ]
-
-    for pid in plugin_order:
+    for pid in PLUGIN_ORDER:
         cfg = getattr(PLUGINS, pid, None)
         if not cfg or not getattr(cfg, "check", False):
             continue
@@ -88,17 +215,16 @@ def load_plugins() -> Dict[str, TgcfPlugin]:
         except Exception as e:
             logging.error(f"❌ 加载失败 {pid}: {e}")
 
+    compile_chain(_plugins)
     return _plugins
 
 
-async def apply_plugins(message: Message) -> TgcfMessage:
+async def apply_plugins(message: Message, text_only: bool = False) -> TgcfMessage:
+    """按编译好的顺序执行插件；text_only 时跳过只处理媒体的插件（用于编辑同步）。"""
     tm = TgcfMessage(message)
-    for pid in ["filter", "ocr", "replace", "caption", "fmt", "mark"]:
-        if pid not in _plugins:
-            continue
-        plugin = _plugins[pid]
+    for plugin, is_async, _ in _text_chain if text_only else _chain:
         try:
-            if inspect.iscoroutinefunction(plugin.modify):
+            if is_async:
                 ntm = await plugin.modify(tm)
             else:
                 ntm = plugin.modify(tm)
@@ -107,28 +233,38 @@ async def apply_plugins(message: Message) -> TgcfMessage:
                 return None
             tm = ntm
         except Exception as e:
-            logging.error(f"❌ 插件执行失败 [{pid}]: {e}")
+            logging.error(f"❌ 插件执行失败 [{plugin.id_}]: {e}")
+        except BaseException:
+            # 处理被取消
+            tm.clear()
+            raise
     return tm
 
 
 async def apply_plugins_to_group(messages: List[Message]) -> List[TgcfMessage]:
     tms = [TgcfMessage(msg) for msg in messages]
-    for pid in ["filter", "ocr", "replace", "caption", "fmt", "mark"]:
-        if pid not in _plugins:
-            continue
-        plugin = _plugins[pid]
-        try:
-            if hasattr(plugin, 'modify_group'):
-                if inspect.iscoroutinefunction(plugin.modify_group):
-                    tms = await plugin.modify_group(tms)
-                else:
-                    tms = plugin.modify_group(tms)
+    # 出现过的所有 TgcfMessage，被插件丢掉的要释放共享下载
+    seen = {id(tm): tm for tm in tms}
+    try:
+        for plugin, _, modify_group in _chain:
+            try:
+                tms = await modify_group(tms)
+            except Exception as e:
+                logging.error(f"❌ 组插件失败 [{plugin.id_}]: {e}")
             else:
-                tms = [await plugin.modify(tm) if inspect.iscoroutinefunction(plugin.modify) else plugin.modify(tm) for tm in tms]
-        except Exception as e:
-            logging.error(f"❌ 组插件失败 [{pid}]: {e}")
-        else:
-            tms = [tm for tm in tms if tm]
+                tms = [tm for tm in tms if tm]
+                seen.update((id(tm), tm) for tm in tms)
+            if not tms:
+                break
+    except BaseException:
+        # 处理被取消
+        tms = []
+        raise
+    finally:
+        kept = {id(tm) for tm in tms}
+        for key, tm in seen.items():
+            if key not in kept:
+                tm.clear()
     return tms
 
 
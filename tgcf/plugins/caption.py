@@ -3,11 +3,14 @@
 import logging
 from typing import List
 
-from tgcf.plugins import TgcfMessage, TgcfPlugin
+from tgcf.plugins import COST_TEXT, TgcfMessage, TgcfPlugin
 
 
 class TgcfCaption(TgcfPlugin):
     id_ = "caption"
+    cost = COST_TEXT
+    reads = frozenset({"text"})
+    writes = frozenset({"text"})
 
     def __init__(self, data) -> None:
         self.caption = data
@@ -2,16 +2,20 @@ import logging
 from typing import List
 
 from tgcf.plugin_models import TextFilter
-from tgcf.plugins import TgcfMessage, TgcfPlugin
-from tgcf.utils import match
+from tgcf.plugins import COST_TEXT, TgcfMessage, TgcfPlugin
+from tgcf.utils import MultiMatcher
 
 
 class TgcfFilter(TgcfPlugin):
     id_ = "filter"
+    cost = COST_TEXT
+    rejects = True
+    reads = frozenset({"text", "sender_id", "file_type"})
 
     def __init__(self, data) -> None:
         self.filters = data
         self.case_correct()
+        self.compile()
         logging.info(self.filters)
 
     def case_correct(self) -> None:
@@ -21,6 +25,14 @@ class TgcfFilter(TgcfPlugin):
             textf.blacklist = [item.lower() for item in textf.blacklist]
             textf.whitelist = [item.lower() for item in textf.whitelist]
 
+    def compile(self) -> None:
+        """加载时一次性编译所有名单，之后每条消息只扫描一遍。"""
+        textf: TextFilter = self.filters.text
+        self.text_blacklist = MultiMatcher(textf.blacklist, textf.regex)
+        self.text_whitelist = MultiMatcher(textf.whitelist, textf.regex)
+        self.users_blacklist = frozenset(self.filters.users.blacklist)
+        self.users_whitelist = frozenset(self.filters.users.whitelist)
+
     def modify(self, tm: TgcfMessage) -> TgcfMessage:
         if self.users_safe(tm):
             logging.info("Message passed users filter")
@@ -45,32 +57,26 @@ class TgcfFilter(TgcfPlugin):
         text = tm.text
         if not flist.case_sensitive:
             text = text.lower()
-        if not text and flist.whitelist == []:
+        if not text and not self.text_whitelist:
             return True
 
         # first check if any blacklisted pattern is present
-        for forbidden in flist.blacklist:
-            if match(forbidden, text, self.filters.text.regex):
-                return False  # when a forbidden pattern is found
+        if self.text_blacklist.search(text):
+            return False  # when a forbidden pattern is found
 
-        if not flist.whitelist:
+        if not self.text_whitelist:
             return True  # if no whitelist is present
 
-        # if whitelist is present
-        for allowed in flist.whitelist:
-            if match(allowed, text, self.filters.text.regex):
-                return True  # only when at least one whitelisted pattern is found
-
-        return False  # 修复：白名单不匹配时显式返回 False
+        # only when at least one whitelisted pattern is found
+        return self.text_whitelist.search(text)
 
     def users_safe(self, tm: TgcfMessage) -> bool:
-        flist = self.filters.users
         sender = str(tm.sender_id)
-        if sender in flist.blacklist:
+        if sender in self.users_blacklist:
             return False
-        if not flist.whitelist:
+        if not self.users_whitelist:
             return True
-        if sender in flist.whitelist:
+        if sender in self.users_whitelist:
             return True
         return False  # 修复：不在白名单中显式返回 False
 
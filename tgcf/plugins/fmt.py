@@ -5,11 +5,14 @@ from enum import Enum
 from typing import Any, Dict
 
 from tgcf.plugin_models import STYLE_CODES, Format, Style
-from tgcf.plugins import TgcfMessage, TgcfPlugin
+from tgcf.plugins import COST_TEXT, TgcfMessage, TgcfPlugin
 
 
 class TgcfFmt(TgcfPlugin):
     id_ = "fmt"
+    cost = COST_TEXT
+    reads = frozenset({"raw_text"})
+    writes = frozenset({"text"})
 
     def __init__(self, data) -> None:
         self.format = data
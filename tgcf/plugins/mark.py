@@ -1,62 +1,186 @@
-import logging  
-import os  
-import shutil  
-from typing import Any, Dict, List  
-  
-import requests  
-from pydantic import BaseModel  
-from watermark import File, Position, Watermark, apply_watermark  
-  
-from tgcf.plugin_models import MarkConfig  
-from tgcf.plugins import TgcfMessage, TgcfPlugin  
-from tgcf.utils import cleanup  
-  
-  
-def download_image(url: str, filename: str = "image.png") -> bool:  
-    if filename in os.listdir():  
-        logging.info("Image for watermarking already exists.")  
-        return True  
-    try:  
-        logging.info(f"Downloading image {url}")  
-        response = requests.get(url, stream=True)  
-        if response.status_code == 200:  
-            logging.info("Got Response 200")  
-            with open(filename, "wb") as file:  
-                response.raw.decode_content = True  
-                shutil.copyfileobj(response.raw, file)  
-    except Exception as err:  
-        logging.error(err)  
-        return False  
-    else:  
-        logging.info("File created image")  
-        return True  
-  
-  
-class TgcfMark(TgcfPlugin):  
-    id_ = "mark"  
-  
-    def __init__(self, data) -> None:  
-        self.data = data  
-  
-    async def modify(self, tm: TgcfMessage) -> TgcfMessage:  
-        if not tm.file_type in ["gif", "video", "photo"]:  
-            return tm  
-        downloaded_file = await tm.get_file()  
-        base = File(downloaded_file)  
-        if self.data.image.startswith("https://"):  
-            download_image(self.data.image)  
-            overlay = File("image.png")  
-        else:  
-            overlay = File(self.data.image)  
-        wtm = Watermark(overlay, self.data.position)  
-        tm.new_file = apply_watermark(base, wtm, frame_rate=self.data.frame_rate)  
-        cleanup(downloaded_file)  
-        tm.cleanup = True  
-        return tm  
-  
-    async def modify_group(self, tms: List[TgcfMessage]) -> List[TgcfMessage]:  
-        """Apply watermark to each media message in the group."""  
-        for tm in tms:  
-            if tm.file_type in ["gif", "video", "photo"]:  
-                await self.modify(tm)  
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+import aiohttp
+from PIL import Image
+from watermark import File, Position, Watermark, apply_watermark
+
+from tgcf.plugin_models import MarkConfig
+from tgcf.plugins import COST_CPU, TgcfMessage, TgcfPlugin
+
+MARKABLE = ["gif", "video", "photo"]
+# 图片水印距边缘的像素
+PHOTO_MARGIN = 5
+# 按目标尺寸缓存缩放好的水印图
+SCALED_CACHE_SIZE = 32
+
+Size = Tuple[int, int]
+
+
+def place(position: Position, base: Size, mark: Size) -> Size:
+    """按 Position 计算水印左上角的坐标。"""
+    name = position.name
+    (bw, bh), (mw, mh) = base, mark
+    x, y = (bw - mw) // 2, (bh - mh) // 2
+    if "left" in name:
+        x = PHOTO_MARGIN
+    elif "right" in name:
+        x = bw - mw - PHOTO_MARGIN
+    if "top" in name:
+        y = PHOTO_MARGIN
+    elif "bottom" in name:
+        y = bh - mh - PHOTO_MARGIN
+    return max(x, 0), max(y, 0)
+
+
+async def download_image(url: str, filename: str = "image.png") -> bool:
+    if os.path.exists(filename):
+        logging.info("Image for watermarking already exists.")
+        return True
+    try:
+        logging.info(f"Downloading image {url}")
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    logging.error(f"Could not download {url}: {response.status}")
+                    return False
+                logging.info("Got Response 200")
+                data = await response.read()
+        with open(filename, "wb") as file:
+            file.write(data)
+    except Exception as err:
+        logging.error(err)
+        return False
+    else:
+        logging.info("File created image")
+        return True
+
+
+class TgcfMark(TgcfPlugin):
+    id_ = "mark"
+    edits_media = True
+    cost = COST_CPU
+    reads = frozenset({"file"})
+    writes = frozenset({"new_file"})
+
+    def __init__(self, data: MarkConfig) -> None:
+        self.data = data
+        # ffmpeg 在子进程里转码，线程只负责等待；并发数按 CPU 核数限制
+        self.workers = data.workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="tgcf-mark"
+        )
+        self.overlay: Optional[str] = None
+        self.overlay_lock = asyncio.Lock()
+        # 图片走 Pillow：水印图只解码一次，按目标尺寸缓存缩放结果
+        self.overlay_image: Optional[Image.Image] = None
+        self.scaled: "OrderedDict[Size, Image.Image]" = OrderedDict()
+        self.scaled_lock = threading.Lock()
+
+    async def get_overlay(self) -> Optional[str]:
+        """返回水印图片路径，远程图片只下载一次。"""
+        async with self.overlay_lock:
+            if self.overlay is None:
+                if self.data.image.startswith("https://"):
+                    if await download_image(self.data.image):
+                        self.overlay = "image.png"
+                else:
+                    self.overlay = self.data.image
+            return self.overlay
+
+    def too_large(self, tm: TgcfMessage) -> bool:
+        """视频与 GIF 超过大小或时长上限时不加水印。"""
+        if tm.file_type == "photo":
+            return False
+        file = tm.message.file
+        size_mb = (file.size or 0) / (1024 * 1024)
+        duration = file.duration or 0
+        if self.data.max_video_size and size_mb > self.data.max_video_size:
+            logging.info(f"⏭️ 视频 {size_mb:.1f}MB 超过上限，跳过水印")
+            return True
+        if self.data.max_video_duration and duration > self.data.max_video_duration:
+            logging.info(f"⏭️ 视频时长 {duration}s 超过上限，跳过水印")
+            return True
+        return False
+
+    def render(self, path: str, overlay: str) -> str:
+        """在工作线程中执行。"""
+        wtm = Watermark(File(overlay), self.data.position)
+        return apply_watermark(File(path), wtm, frame_rate=self.data.frame_rate)
+
+    def scaled_overlay(self, overlay: str, size: Size) -> Image.Image:
+        """返回适合 size 的水印图：不超出底图时保持原大小，否则等比缩小。"""
+        with self.scaled_lock:
+            mark = self.scaled.get(size)
+            if mark is not None:
+                self.scaled.move_to_end(size)
+                return mark
+            if self.overlay_image is None:
+                with Image.open(overlay) as image:
+                    self.overlay_image = image.convert("RGBA")
+            mark = self.overlay_image
+            width, height = size
+            scale = min(
+                1.0,
+                (width - 2 * PHOTO_MARGIN) / mark.width,
+                (height - 2 * PHOTO_MARGIN) / mark.height,
+            )
+            if scale < 1.0:
+                mark = mark.resize(
+                    (max(1, int(mark.width * scale)), max(1, int(mark.height * scale))),
+                    Image.LANCZOS,
+                )
+            self.scaled[size] = mark
+            if len(self.scaled) > SCALED_CACHE_SIZE:
+                self.scaled.popitem(last=False)
+            return mark
+
+    def render_photo(self, data: bytes, overlay: str) -> BytesIO:
+        """在工作线程中用 Pillow 给图片加水印，结果直接写入内存。"""
+        with Image.open(BytesIO(data)) as image:
+            base = image.convert("RGBA")
+        mark = self.scaled_overlay(overlay, base.size)
+        base.alpha_composite(mark, place(self.data.position, base.size, mark.size))
+        out = BytesIO()
+        base.convert("RGB").save(out, "JPEG", quality=95)
+        out.name = "watermarked.jpg"
+        out.seek(0)
+        return out
+
+    async def modify(self, tm: TgcfMessage) -> TgcfMessage:
+        if not tm.file_type in MARKABLE or self.too_large(tm):
+            return tm
+        overlay = await self.get_overlay()
+        if overlay is None:
+            return tm
+        loop = asyncio.get_running_loop()
+        if tm.file_type == "photo":
+            data = await tm.get_bytes()
+            tm.new_file = await loop.run_in_executor(
+                self.executor, self.render_photo, data, overlay
+            )
+        else:
+            downloaded_file = await tm.get_file()
+            tm.new_file = await loop.run_in_executor(
+                self.executor, self.render, downloaded_file, overlay
+            )
+        # 下载的原文件由共享缓存在消息处理完后删除
+        tm.cleanup = True
+        return tm
+
+    async def modify_group(self, tms: List[TgcfMessage]) -> List[TgcfMessage]:
+        """Apply watermark to all media messages in the group in parallel."""
+        results = await asyncio.gather(
+            *(self.modify(tm) for tm in tms if tm.file_type in MARKABLE),
+            return_exceptions=True,
+        )
+        for res in results:
+            if isinstance(res, Exception):
+                logging.error(f"❌ 水印失败: {res}")
         return tms
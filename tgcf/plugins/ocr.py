@@ -1,22 +1,85 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import List, Optional
+
 import pytesseract
 from PIL import Image
 
-from tgcf.plugins import TgcfMessage, TgcfPlugin
-from tgcf.utils import cleanup
+from tgcf.plugins import COST_CPU, TgcfMessage, TgcfPlugin
+
+# 按照片 ID 缓存识别结果，编辑同步时不必重新下载识别
+OCR_CACHE_SIZE = 1000
+# 进程池超时后再多等一会儿，让 tesseract 自己的超时先生效
+TIMEOUT_GRACE = 5
+
+
+def image_to_text(data: bytes, timeout: float) -> str:
+    """在子进程中执行，超时时 pytesseract 会结束 tesseract 进程。"""
+    return pytesseract.image_to_string(Image.open(BytesIO(data)), timeout=timeout)
 
 
 class TgcfOcr(TgcfPlugin):
     id_ = "ocr"
+    cost = COST_CPU
+    reads = frozenset({"file"})
+    writes = frozenset({"text"})
 
     def __init__(self, data) -> None:
-        pass
+        self.data = data
+        self.workers = data.workers or os.cpu_count() or 1
+        self.results: "OrderedDict[int, str]" = OrderedDict()
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.in_flight = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            logging.info(f"🔍 OCR 进程池: {self.workers} 个进程")
+        return self.pool
+
+    async def _recognize(self, data: bytes) -> Optional[str]:
+        if self.in_flight >= self.workers + self.data.max_queue:
+            logging.warning(f"⚠️ OCR 队列已满（{self.in_flight}），跳过本张图片")
+            return None
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            job = loop.run_in_executor(
+                self._pool(), image_to_text, data, self.data.timeout
+            )
+            limit = self.data.timeout + TIMEOUT_GRACE if self.data.timeout > 0 else None
+            return await asyncio.wait_for(job, limit)
+        except Exception as err:
+            logging.error(f"❌ OCR 失败: {err!r}")
+            return None
+        finally:
+            self.in_flight -= 1
 
     async def modify(self, tm: TgcfMessage) -> TgcfMessage:
 
         if not tm.file_type in ["photo"]:
             return tm
 
-        file = await tm.get_file()
-        tm.text = pytesseract.image_to_string(Image.open(file))
-        cleanup(file)
+        photo_id = tm.message.photo.id
+        if photo_id in self.results:
+            self.results.move_to_end(photo_id)
+            tm.text = self.results[photo_id]
+            return tm
+
+        text = await self._recognize(await tm.get_bytes())
+        if text is None:
+            return tm
+        tm.text = text
+
+        self.results[photo_id] = tm.text
+        if len(self.results) > OCR_CACHE_SIZE:
+            self.results.popitem(last=False)
         return tm
+
+    async def modify_group(self, tms: List[TgcfMessage]) -> List[TgcfMessage]:
+        """相册中的图片并行识别。"""
+        return list(await asyncio.gather(*(self.modify(tm) for tm in tms if tm)))
@@ -3,16 +3,20 @@
 import logging
 from typing import Any, Dict, List
 
-# ✅ 关键修复：显式导入 replace 函数
-from tgcf.utils import replace as utils_replace
-from tgcf.plugins import TgcfMessage, TgcfPlugin
+from tgcf.utils import ReplaceEngine
+from tgcf.plugins import COST_TEXT, TgcfMessage, TgcfPlugin
 
 
 class TgcfReplace(TgcfPlugin):
     id_ = "replace"
+    cost = COST_TEXT
+    reads = frozenset({"raw_text"})
+    writes = frozenset({"text"})
 
     def __init__(self, data):
         self.replace = data
+        # 加载时编译全部规则，每条消息不再逐条重新编译、重新扫描
+        self.engine = ReplaceEngine(data.text, data.regex)
         logging.info(f"🔧 加载替换规则: {data.text}")
 
     def modify(self, tm: TgcfMessage) -> TgcfMessage:
@@ -20,18 +24,11 @@ class TgcfReplace(TgcfPlugin):
         if not raw_text:
             return tm
 
-        current_text = raw_text
-        for original, new in self.replace.text.items():
-            current_text = utils_replace(original, new, current_text, self.replace.regex)
-
-        tm.text = current_text
+        tm.text = self.engine.apply(raw_text)
         return tm
 
     def modify_group(self, tms: List[TgcfMessage]) -> List[TgcfMessage]:
         for tm in tms:
             if tm.raw_text:
-                text = tm.raw_text
-                for original, new in self.replace.text.items():
-                    text = utils_replace(original, new, text, self.replace.regex)
-                tm.text = text
+                tm.text = self.engine.apply(tm.raw_text)
         return tms
@@ -1,18 +1,24 @@
 import logging
 import sys
 
-from tgcf.plugins import TgcfMessage, TgcfPlugin
+from tgcf.plugins import COST_DOWNLOAD, TgcfMessage, TgcfPlugin
 from tgcf.config import CONFIG, get_SESSION
+from tgcf.const import FLOOD_SLEEP_THRESHOLD
 from telethon import TelegramClient
 
 class TgcfSender(TgcfPlugin):
     id_ = "sender"
+    edits_media = True
+    cost = COST_DOWNLOAD
+    reads = frozenset({"file"})
+    writes = frozenset({"client", "new_file"})
     
     async def __ainit__(self) -> None:
         sender = TelegramClient(
             get_SESSION(CONFIG.plugins.sender, 'tgcf_sender'),
             CONFIG.login.API_ID,
             CONFIG.login.API_HASH,
+            flood_sleep_threshold=FLOOD_SLEEP_THRESHOLD,
         )
         if self.data.user_type == 0:
             if self.data.BOT_TOKEN == "":
@@ -26,6 +32,7 @@ class TgcfSender(TgcfPlugin):
     async def modify(self, tm: TgcfMessage) -> TgcfMessage:
         tm.client = self.sender
         if tm.file_type != "nofile":
+            # 文件归共享下载缓存所有，clear 时随引用计数释放
             tm.new_file = await tm.get_file()
-            tm.cleanup = True
+            tm.cleanup = False
         return tm
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""主动限流：令牌桶（全局 / 账号 / 目标会话）。
+
+所有发送路径在调用 Telegram 之前先 acquire，遇到 FloodWait 时上报，
+限流器据此冻结对应会话并降低它的速率，之后随成功发送逐步恢复。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from tgcf.config import CONFIG
+
+# FloodWait 后速率的乘性下降系数与每次成功后的恢复比例
+FLOOD_DECREASE = 0.5
+SUCCESS_RECOVERY = 0.05
+MIN_RATE = 1 / 60
+# 单个会话的 FloodWait 对整个账号只做轻微下调
+ACCOUNT_FLOOD_DECREASE = 0.95
+
+
+class TokenBucket:
+    """一个可学习的令牌桶，rate 为每秒令牌数。"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.default_rate = rate
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.flood_waits = 0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """距离下一个可用令牌还需等待的秒数，0 表示立即可用。"""
+        self._refill(now)
+        wait = max(self.blocked_until - now, 0.0)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def penalize(self, seconds: float, now: float) -> None:
+        self.flood_waits += 1
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        # 冻结结束时恰好放行一条，之后按降低后的速率补充
+        self.tokens = 1
+        self.updated = self.blocked_until
+        self.rate = max(MIN_RATE, self.rate * FLOOD_DECREASE)
+
+    def recover(self) -> None:
+        if self.rate < self.default_rate:
+            self.rate = min(
+                self.default_rate, self.rate + self.default_rate * SUCCESS_RECOVERY
+            )
+
+    def state(self, now: float) -> Dict[str, Any]:
+        self._refill(now)
+        return {
+            "rate": round(self.rate, 4),
+            "default_rate": round(self.default_rate, 4),
+            "tokens": round(self.tokens, 2),
+            "blocked_for": round(max(self.blocked_until - now, 0.0), 1),
+            "flood_waits": self.flood_waits,
+        }
+
+
+class RateLimiter:
+    """按 全局 → 账号 → 目标会话 三级令牌桶限流。"""
+
+    def __init__(self) -> None:
+        self.settings = CONFIG.rate_limit
+        self.global_bucket = TokenBucket(
+            self.settings.global_per_second, self.settings.global_per_second
+        )
+        self.accounts: Dict[int, TokenBucket] = {}
+        self.chats: Dict[int, TokenBucket] = {}
+        # FloodWait 的订阅者，例如 past 模式的节奏控制
+        self.flood_listeners: List[Callable[[int, float], None]] = []
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id < 0:
+                # 群组与频道：Telegram 限制约每分钟 20 条
+                per_minute = self.settings.group_per_minute
+                bucket = TokenBucket(per_minute / 60, per_minute)
+            else:
+                bucket = TokenBucket(self.settings.chat_per_second, self.settings.burst)
+            self.chats[chat_id] = bucket
+        return bucket
+
+    def default_rate(self, chat_id: int) -> float:
+        """该会话未受 FloodWait 影响时的速率（条/秒）。"""
+        return self._chat_bucket(chat_id).default_rate
+
+    def _account_bucket(self, client: Any) -> TokenBucket:
+        key = id(client)
+        bucket = self.accounts.get(key)
+        if bucket is None:
+            bucket = TokenBucket(
+                self.settings.account_per_second, self.settings.account_per_second
+            )
+            self.accounts[key] = bucket
+        return bucket
+
+    def _buckets(self, chat_id: int, client: Any) -> List[TokenBucket]:
+        buckets = [self.global_bucket, self._chat_bucket(chat_id)]
+        if client is not None:
+            buckets.append(self._account_bucket(client))
+        return buckets
+
+    async def acquire(self, chat_id: int, client: Any = None) -> None:
+        """等待直到所有相关的桶都有令牌，然后同时扣除。"""
+        if not self.settings.enabled:
+            return
+        buckets = self._buckets(chat_id, client)
+        while True:
+            now = time.monotonic()
+            wait = max(bucket.wait_time(now) for bucket in buckets)
+            if wait <= 0:
+                for bucket in buckets:
+                    bucket.consume(now)
+                return
+            await asyncio.sleep(wait)
+
+    def on_flood_wait(self, chat_id: int, seconds: float, client: Any = None) -> None:
+        """记录一次 FloodWait：冻结该会话并降低会话与账号的速率。"""
+        now = time.monotonic()
+        self._chat_bucket(chat_id).penalize(seconds, now)
+        if client is not None:
+            account = self._account_bucket(client)
+            account.flood_waits += 1
+            account.rate = max(MIN_RATE, account.rate * ACCOUNT_FLOOD_DECREASE)
+        logging.warning(
+            f"⛔ FloodWait {seconds}s @ {chat_id}，"
+            f"速率降为 {self.chats[chat_id].rate:.3f}/s"
+        )
+        for listener in self.flood_listeners:
+            listener(chat_id, seconds)
+
+    def on_success(self, chat_id: int, client: Any = None) -> None:
+        self._chat_bucket(chat_id).recover()
+        if client is not None:
+            self._account_bucket(client).recover()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回所有桶的当前状态，用于监控。"""
+        now = time.monotonic()
+        return {
+            "enabled": self.settings.enabled,
+            "global": self.global_bucket.state(now),
+            "accounts": {
+                str(key): bucket.state(now) for key, bucket in self.accounts.items()
+            },
+            "chats": {
+                str(key): bucket.state(now) for key, bucket in self.chats.items()
+            },
+        }
+
+
+_limiter: Optional[RateLimiter] = None
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
@@ -7,10 +7,23 @@ import os
 import sys
 import platform
 import random
+from collections import OrderedDict
 from datetime import datetime
-from typing import TYPE_CHECKING, List, Optional, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from telethon.client import TelegramClient
+from telethon.errors import RPCError
+from telethon.errors.rpcerrorlist import FloodWaitError
 from telethon.hints import EntityLike
 from telethon.tl.custom.message import Message
 from telethon.tl.types import (
@@ -25,12 +38,18 @@ from telethon.tl.types import (
     InputSingleMedia,
     MessageMediaPhoto,
     MessageMediaDocument,
+    MessageMediaWebPage,
+)
+from telethon.tl.functions.messages import (
+    ForwardMessagesRequest,
+    SendMediaRequest,
+    SendMultiMediaRequest,
 )
-from telethon.tl.functions.messages import SendMediaRequest, SendMultiMediaRequest
 
-from tgcf import __version__
+from tgcf import __version__, const
 from tgcf.config import CONFIG
 from tgcf.plugin_models import STYLE_CODES
+from tgcf.ratelimit import get_limiter
 
 if TYPE_CHECKING:
     from tgcf.plugins import TgcfMessage
@@ -50,17 +69,46 @@ def _has_spoiler(message: Message) -> bool:
     return getattr(message.media, 'spoiler', False)
 
 
-async def _send_single_with_spoiler(
-    client: TelegramClient,
-    recipient: EntityLike,
-    message: Message,
-    caption: Optional[str] = None,
-    reply_to: Optional[int] = None,
-) -> Message:
-    """通过底层 API 发送单条带 spoiler 的媒体消息。"""
-    media = message.media
-    peer = await client.get_input_entity(recipient)
+# =====================================================================
+#  InputPeer / InputMedia 缓存
+# =====================================================================
+
+# (id(client), recipient) → InputPeer；不同账号的 access_hash 不同，需分开缓存
+_PEER_CACHE: Dict[Tuple[int, Any], Any] = {}
+# (chat_id, msg_id, spoiler) → InputMedia，多目标发送同一条消息时复用
+_INPUT_MEDIA_CACHE: "OrderedDict[Tuple[int, int, bool], Any]" = OrderedDict()
+INPUT_MEDIA_CACHE_SIZE = 256
+
+
+async def get_input_peer(client: TelegramClient, recipient: EntityLike):
+    key = (id(client), recipient)
+    peer = _PEER_CACHE.get(key)
+    if peer is None:
+        peer = await client.get_input_entity(recipient)
+        _PEER_CACHE[key] = peer
+    return peer
 
+
+async def warm_peer_cache(client: TelegramClient, from_to: Dict[int, List[int]]) -> None:
+    """启动时预先解析所有目标会话。"""
+    for dests in from_to.values():
+        for d in dests:
+            try:
+                await get_input_peer(client, d)
+            except Exception as e:
+                logging.warning(f"⚠️ 无法解析目标 {d}: {e}")
+    logging.info(f"📇 已缓存 {len(_PEER_CACHE)} 个目标会话")
+
+
+def _input_media(message: Message, spoiler: bool):
+    """构造（或取缓存的）消息媒体对应的 InputMedia，不支持时返回 None。"""
+    key = (message.chat_id, message.id, spoiler)
+    cached = _INPUT_MEDIA_CACHE.get(key)
+    if cached is not None:
+        _INPUT_MEDIA_CACHE.move_to_end(key)
+        return cached
+
+    media = message.media
     if isinstance(media, MessageMediaPhoto) and media.photo:
         photo = media.photo
         input_media = InputMediaPhoto(
@@ -69,7 +117,7 @@ async def _send_single_with_spoiler(
                 access_hash=photo.access_hash,
                 file_reference=photo.file_reference,
             ),
-            spoiler=True,
+            spoiler=spoiler,
         )
     elif isinstance(media, MessageMediaDocument) and media.document:
         doc = media.document
@@ -79,10 +127,29 @@ async def _send_single_with_spoiler(
                 access_hash=doc.access_hash,
                 file_reference=doc.file_reference,
             ),
-            spoiler=True,
+            spoiler=spoiler,
         )
     else:
-        raise ValueError(f"不支持的媒体类型: {type(media)}")
+        return None
+
+    _INPUT_MEDIA_CACHE[key] = input_media
+    while len(_INPUT_MEDIA_CACHE) > INPUT_MEDIA_CACHE_SIZE:
+        _INPUT_MEDIA_CACHE.popitem(last=False)
+    return input_media
+
+
+async def _send_single_with_spoiler(
+    client: TelegramClient,
+    recipient: EntityLike,
+    message: Message,
+    caption: Optional[str] = None,
+    reply_to: Optional[int] = None,
+) -> Message:
+    """通过底层 API 发送单条带 spoiler 的媒体消息。"""
+    peer = await get_input_peer(client, recipient)
+    input_media = _input_media(message, spoiler=True)
+    if input_media is None:
+        raise ValueError(f"不支持的媒体类型: {type(message.media)}")
 
     result = await client(SendMediaRequest(
         peer=peer,
@@ -107,41 +174,18 @@ async def _send_album_with_spoiler(
     reply_to: Optional[int] = None,
 ) -> List[Message]:
     """通过底层 SendMultiMedia API 发送媒体组，逐条保留 spoiler 属性。"""
-    peer = await client.get_input_entity(recipient)
+    peer = await get_input_peer(client, recipient)
     multi_media = []
 
     for i, msg in enumerate(grouped_messages):
-        media = msg.media
-        is_spoiler = _has_spoiler(msg)
         msg_text = caption if (i == 0 and caption) else ""
-
-        input_media = None
-
-        if isinstance(media, MessageMediaPhoto) and media.photo:
-            photo = media.photo
-            input_media = InputMediaPhoto(
-                id=InputPhoto(
-                    id=photo.id,
-                    access_hash=photo.access_hash,
-                    file_reference=photo.file_reference,
-                ),
-                spoiler=is_spoiler,
-            )
-        elif isinstance(media, MessageMediaDocument) and media.document:
-            doc = media.document
-            input_media = InputMediaDocument(
-                id=InputDocument(
-                    id=doc.id,
-                    access_hash=doc.access_hash,
-                    file_reference=doc.file_reference,
-                ),
-                spoiler=is_spoiler,
-            )
+        input_media = _input_media(msg, spoiler=_has_spoiler(msg))
 
         if input_media is None:
-            logging.warning(f"⚠️ 跳过无法识别的媒体类型: {type(media)}")
+            logging.warning(f"⚠️ 跳过无法识别的媒体类型: {type(msg.media)}")
             continue
 
+        # 每个目标只需要新的 random_id，InputMedia 本身可以复用
         single = InputSingleMedia(
             media=input_media,
             random_id=random.randrange(-2**63, 2**63),
@@ -171,6 +215,121 @@ async def _send_album_with_spoiler(
     return sent_messages if sent_messages else result
 
 
+# =====================================================================
+#  限流与重试
+# =====================================================================
+
+async def call_limited(
+    client: TelegramClient,
+    recipient: EntityLike,
+    call: Callable[[], Awaitable[Any]],
+    label: str,
+    attempts: int = const.MAX_SEND_ATTEMPTS,
+) -> Any:
+    """经过限流器执行一次发送类调用。
+
+    FloodWait 交给限流器冻结对应目标后重试（不计入次数），
+    其他异常最多尝试 attempts 次，之后抛出。
+    """
+    limiter = get_limiter()
+    attempt = 0
+    while True:
+        await limiter.acquire(recipient, client)
+        try:
+            result = await call()
+        except FloodWaitError as e:
+            limiter.on_flood_wait(recipient, e.seconds, client)
+            logging.critical(f"⛔ FloodWait: {label}需等待 {e.seconds} 秒")
+            continue
+        except Exception as e:
+            attempt += 1
+            logging.error(f"❌ {label}失败 (attempt {attempt}): {e}")
+            if attempt >= attempts:
+                raise
+            await asyncio.sleep(min(5 * 2 ** attempt, 300))
+            continue
+        limiter.on_success(recipient, client)
+        return result
+
+
+# =====================================================================
+#  插件生成文件：一次上传，多目标复用
+# =====================================================================
+
+class UploadOnce:
+    """同一条消息（或媒体组）的新文件只上传一次。
+
+    第一个目标正常上传并发送，之后的目标直接复用服务器上已有的媒体。
+    """
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.media = None
+
+    async def send(self, client: TelegramClient, recipient: EntityLike, files, **kwargs):
+        async with self.lock:
+            if self.media is None:
+                # 内存文件在失败重试时要从头读
+                for file in files if isinstance(files, list) else [files]:
+                    if hasattr(file, "seek"):
+                        file.seek(0)
+                result = await client.send_file(recipient, files, **kwargs)
+                sent = result if isinstance(result, list) else [result]
+                media = [msg.media for msg in sent]
+                self.media = media if isinstance(files, list) else media[0]
+                return result
+        return await client.send_file(recipient, self.media, **kwargs)
+
+
+# =====================================================================
+#  服务端复制（drop_author）
+# =====================================================================
+
+def server_copy_captions(tms: List["TgcfMessage"]) -> Optional[bool]:
+    """判断能否用服务端转发（去掉来源）代替复制发送。
+
+    返回 None 表示不能；否则返回是否需要 drop_media_captions。
+    只有媒体未被插件替换、文字未改动（或媒体说明被整体清空）时才可以。
+    """
+    drop_captions = False
+    for tm in tms:
+        if tm.new_file or tm.client is not tm.message.client:
+            return None
+        if tm.text == tm.original_text:
+            continue
+        if tm.text or not tm.message.media:
+            return None
+        drop_captions = True
+    if drop_captions and any(tm.text for tm in tms if tm.message.media):
+        # drop_media_captions 会清空所有说明，不能只清其中一部分
+        return None
+    return drop_captions
+
+
+async def forward_copies(
+    client: TelegramClient,
+    recipient: EntityLike,
+    messages: List[Message],
+    drop_author: bool,
+    drop_media_captions: bool = False,
+) -> List[Optional[Message]]:
+    """通过底层 ForwardMessages API 转发同一会话的一批消息。
+
+    client.forward_messages 不接受 drop_author / drop_media_captions，
+    这里直接发送请求。返回值与 messages 一一对应，未发出的位置为 None。
+    """
+    peer = await get_input_peer(client, recipient)
+    request = ForwardMessagesRequest(
+        from_peer=await client.get_input_entity(messages[0].peer_id),
+        id=[m.id for m in messages],
+        to_peer=peer,
+        drop_author=drop_author or None,
+        drop_media_captions=drop_media_captions or None,
+    )
+    result = await client(request)
+    return client._get_response_message(request, result, peer)
+
+
 # =====================================================================
 #  主发送函数
 # =====================================================================
@@ -195,24 +354,36 @@ async def send_message(
 
     # === 情况 1: 直接转发（保留 forwarded from） ===
     if CONFIG.show_forwarded_from and grouped_messages:
-        attempt = 0
-        delay = 5
-        while True:
+        result = await call_limited(
+            client, recipient,
+            lambda: client.forward_messages(recipient, grouped_messages),
+            "转发媒体组",
+        )
+        logging.info("✅ 直接转发媒体组成功")
+        return result
+
+    # === 情况 1b: 服务端复制，无需下载与重新上传 ===
+    # 转发无法设置 reply_to，回复消息仍走复制发送
+    if CONFIG.server_copy and tm.reply_to is None:
+        copy_tms = grouped_tms if grouped_messages and grouped_tms else [tm]
+        drop_captions = server_copy_captions(copy_tms)
+        if drop_captions is not None:
+            messages = [ctm.message for ctm in copy_tms]
             try:
-                result = await client.forward_messages(recipient, grouped_messages)
-                logging.info(f"✅ 直接转发媒体组成功 (attempt {attempt+1})")
-                return result
-            except Exception as e:
-                if "FLOOD_WAIT" in str(e).upper():
-                    wait_sec = int(re.search(r'\d+', str(e)).group())
-                    logging.critical(f"⛔ FloodWait: 等待 {wait_sec} 秒")
-                    await asyncio.sleep(wait_sec + 10)
-                    delay = 60
-                else:
-                    logging.error(f"❌ 转发失败 (attempt {attempt+1}): {e}")
-            attempt += 1
-            delay = min(delay * 2, 300)
-            await asyncio.sleep(delay)
+                result = await call_limited(
+                    client, recipient,
+                    lambda: forward_copies(
+                        client, recipient, messages,
+                        drop_author=True,
+                        drop_media_captions=drop_captions,
+                    ),
+                    "服务端复制",
+                    attempts=1,
+                )
+                logging.info(f"✅ 服务端复制成功 ({len(messages)} 条)")
+                return result if grouped_messages else result[0]
+            except RPCError as e:
+                logging.warning(f"⚠️ 服务端复制失败，回退普通发送: {e}")
 
     # === 情况 2: 媒体组复制发送 ===
     if grouped_messages and grouped_tms:
@@ -222,67 +393,69 @@ async def send_message(
         ])
 
         any_spoiler = any(_has_spoiler(msg) for msg in grouped_messages)
-
-        attempt = 0
-        delay = 5
-        while True:
-            try:
-                if any_spoiler:
-                    logging.info("🔒 检测到 Spoiler，使用底层 API 发送")
-                    result = await _send_album_with_spoiler(
-                        client, recipient, grouped_messages,
-                        caption=combined_caption or None,
-                        reply_to=tm.reply_to,
-                    )
-                else:
-                    files_to_send = [
-                        msg for msg in grouped_messages
-                        if msg.photo or msg.video or msg.gif or msg.document
-                    ]
-                    if not files_to_send:
-                        return await client.send_message(
-                            recipient,
-                            combined_caption or "空相册",
-                            reply_to=tm.reply_to,
-                        )
-                    result = await client.send_file(
-                        recipient, files_to_send,
-                        caption=combined_caption or None,
-                        reply_to=tm.reply_to,
-                        supports_streaming=True,
-                        force_document=False,
-                        allow_cache=False,
-                        parse_mode="md",
-                    )
-
-                logging.info(
-                    f"✅ 媒体组发送成功"
-                    f"{'（含 spoiler）' if any_spoiler else ''}"
-                    f" (attempt {attempt+1})"
+        any_new_file = any(gtm.new_file for gtm in grouped_tms)
+
+        async def _send_album():
+            if any_new_file:
+                files = [
+                    gtm.new_file or gtm.message for gtm in grouped_tms
+                    if gtm.new_file or gtm.message.media
+                ]
+                return await tm.uploaded.send(
+                    client, recipient, files,
+                    caption=combined_caption or None,
+                    reply_to=tm.reply_to,
+                    supports_streaming=True,
+                    force_document=False,
+                    parse_mode="md",
                 )
-                return result
+            if any_spoiler:
+                logging.info("🔒 检测到 Spoiler，使用底层 API 发送")
+                return await _send_album_with_spoiler(
+                    client, recipient, grouped_messages,
+                    caption=combined_caption or None,
+                    reply_to=tm.reply_to,
+                )
+            files_to_send = [
+                msg for msg in grouped_messages
+                if msg.photo or msg.video or msg.gif or msg.document
+            ]
+            if not files_to_send:
+                return await client.send_message(
+                    recipient,
+                    combined_caption or "空相册",
+                    reply_to=tm.reply_to,
+                )
+            return await client.send_file(
+                recipient, files_to_send,
+                caption=combined_caption or None,
+                reply_to=tm.reply_to,
+                supports_streaming=True,
+                force_document=False,
+                allow_cache=False,
+                parse_mode="md",
+            )
 
-            except Exception as e:
-                if "FLOOD_WAIT" in str(e).upper():
-                    wait_sec = int(re.search(r'\d+', str(e)).group())
-                    logging.critical(f"⛔ FloodWait: 等待 {wait_sec} 秒")
-                    await asyncio.sleep(wait_sec + 10)
-                    delay = 60
-                else:
-                    logging.error(f"❌ 媒体组发送失败 (attempt {attempt+1}): {e}")
-            attempt += 1
-            delay = min(delay * 2, 300)
-            await asyncio.sleep(delay)
+        result = await call_limited(client, recipient, _send_album, "媒体组发送")
+        logging.info(
+            f"✅ 媒体组发送成功{'（含 spoiler）' if any_spoiler else ''}"
+        )
+        return result
 
     # === 情况 3: 单条消息 ===
     # 3a: 插件生成了新文件
     if tm.new_file:
         try:
-            return await client.send_file(
-                recipient, tm.new_file,
-                caption=tm.text,
-                reply_to=tm.reply_to,
-                supports_streaming=True,
+            return await call_limited(
+                client, recipient,
+                lambda: tm.uploaded.send(
+                    client, recipient, tm.new_file,
+                    caption=tm.text,
+                    reply_to=tm.reply_to,
+                    supports_streaming=True,
+                ),
+                "新文件发送",
+                attempts=1,
             )
         except Exception as e:
             logging.error(f"❌ 新文件发送失败: {e}")
@@ -291,9 +464,14 @@ async def send_message(
     if _has_spoiler(tm.message):
         logging.info("🔒 单条 Spoiler 消息，使用底层 API")
         try:
-            result = await _send_single_with_spoiler(
-                client, recipient, tm.message,
-                caption=tm.text, reply_to=tm.reply_to,
+            result = await call_limited(
+                client, recipient,
+                lambda: _send_single_with_spoiler(
+                    client, recipient, tm.message,
+                    caption=tm.text, reply_to=tm.reply_to,
+                ),
+                "spoiler 单条发送",
+                attempts=1,
             )
             logging.info("✅ 带 spoiler 单条消息发送成功")
             return result
@@ -301,9 +479,22 @@ async def send_message(
             logging.warning(f"⚠️ spoiler 发送失败，回退普通模式: {e}")
 
     # 3c: 普通消息
+    # 不改写 tm.message：其他目标还要用原文判断消息是否被插件改动过
+    message = tm.message
+    media = None if isinstance(message.media, MessageMediaWebPage) else message.media
     try:
-        tm.message.text = tm.text
-        return await client.send_message(recipient, tm.message, reply_to=tm.reply_to)
+        return await call_limited(
+            client, recipient,
+            lambda: client.send_message(
+                recipient, tm.text,
+                file=media,
+                reply_to=tm.reply_to,
+                link_preview=bool(message.web_preview),
+                silent=message.silent,
+            ),
+            "消息发送",
+            attempts=1,
+        )
     except Exception as e:
         logging.error(f"❌ 消息发送失败: {e}")
         return None
@@ -342,6 +533,151 @@ def match(pattern: str, string: str, regex: bool) -> bool:
     return pattern in string
 
 
+# 正则里有特殊含义的字符；不含这些字符的正则等同于普通文本
+REGEX_SPECIAL = frozenset(".^$*+?{}[]\\|()")
+
+
+def _is_literal(pattern: str) -> bool:
+    return not any(ch in REGEX_SPECIAL for ch in pattern)
+
+
+# 关键词少于该数量时逐个 `in` 更快，超过后改用 Aho-Corasick 自动机
+AUTOMATON_MIN_KEYWORDS = 150
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 自动机：一次扫描查找文本中的所有关键词。"""
+
+    def __init__(self, keywords: List[str]) -> None:
+        self.keywords = keywords
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # 在该状态结束的关键词下标（含经失败链到达的更短关键词）
+        self.out: List[List[int]] = [[]]
+        for index, word in enumerate(keywords):
+            node = 0
+            for ch in word:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append(index)
+        self._link()
+
+    def _link(self) -> None:
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def search(self, text: str) -> bool:
+        goto, fail, out = self.goto, self.fail, self.out
+        if out[0]:
+            return True  # 含有空关键词
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                return True
+        return False
+
+    def replace_all(self, text: str, replacements: List[str]) -> str:
+        """一次扫描完成替换，结果与按顺序对每个关键词调用 str.replace 相同。
+
+        前提是前面关键词的替换文本与周围文字拼起来不会产生后面的关键词。
+        重叠的出现按关键词顺序取舍：前面的关键词先占位，同一关键词
+        取最左边且不重叠的出现，和逐个 str.replace 的结果一致。
+        """
+        goto, fail, out, keywords = self.goto, self.fail, self.out, self.keywords
+        found = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for index in out[node]:
+                found.append((index, i + 1 - len(keywords[index])))
+        if not found:
+            return text
+
+        found.sort()
+        taken = bytearray(len(text))
+        chosen = []
+        for index, start in found:
+            end = start + len(keywords[index])
+            if taken.find(1, start, end) == -1:
+                taken[start:end] = b"\x01" * (end - start)
+                chosen.append((start, end, index))
+        chosen.sort()
+
+        parts = []
+        last = 0
+        for start, end, index in chosen:
+            parts.append(text[last:start])
+            parts.append(replacements[index])
+            last = end
+        parts.append(text[last:])
+        return "".join(parts)
+
+
+class MultiMatcher:
+    """预编译的一组模式，search(text) 与对每个模式调用 match 的结果相同。
+
+    普通关键词（包括不含元字符的"正则"）较多时使用 Aho-Corasick，
+    其余正则在加载时编译好，逐个搜索，命中即返回。
+    """
+
+    def __init__(self, patterns: List[str], regex: bool) -> None:
+        self.patterns = list(patterns)
+        self.keywords: List[str] = []
+        self.automaton: Optional[KeywordAutomaton] = None
+        self.compiled: List[re.Pattern] = []
+        if regex:
+            literals = [p for p in self.patterns if _is_literal(p)]
+            self._compile_regex([p for p in self.patterns if not _is_literal(p)])
+        else:
+            literals = self.patterns
+        if len(literals) >= AUTOMATON_MIN_KEYWORDS:
+            self.automaton = KeywordAutomaton(literals)
+        else:
+            self.keywords = literals
+
+    def _compile_regex(self, patterns: List[str]) -> None:
+        # 不合并成一个交替表达式：sre 会在每个位置逐个尝试分支，
+        # 实测比分别搜索（可利用各自的字面量前缀快速定位）更慢
+        for pattern in patterns:
+            try:
+                self.compiled.append(re.compile(pattern))
+            except re.error as err:
+                logging.error(f"❌ 无效的正则 {pattern!r}，已忽略: {err}")
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+    def search(self, text: str) -> bool:
+        if self.automaton is not None and self.automaton.search(text):
+            return True
+        for keyword in self.keywords:
+            if keyword in text:
+                return True
+        for compiled in self.compiled:
+            if compiled.search(text):
+                return True
+        return False
+
+
 def replace(pattern: str, new: str, string: str, regex: bool) -> str:
     def fmt_repl(matched):
         style = new
@@ -360,6 +696,99 @@ def replace(pattern: str, new: str, string: str, regex: bool) -> str:
         return string.replace(pattern, new)
 
 
+def _overlaps(x: str, y: str) -> bool:
+    """x 与 y 能否在文本中重叠：一方包含另一方，或一方的后缀是另一方的前缀。"""
+    if not x or not y:
+        return True
+    if y[0] not in x and x[0] not in y:
+        return False
+    if x in y or y in x:
+        return True
+    for k in range(1, min(len(x), len(y))):
+        if x.endswith(y[:k]) or y.endswith(x[:k]):
+            return True
+    return False
+
+
+class ReplaceEngine:
+    """加载时编译好的替换规则，apply(text) 与依次调用 replace 的结果相同。
+
+    正则在这里预编译；不含元字符的正则（替换文本也不含反向引用）
+    按普通文本处理。相邻的普通规则只要前面规则的替换文本与周围文字
+    拼起来不会产生后面规则的原文，就合并成一组；规则足够多的组用
+    Aho-Corasick 一次扫描完成，其余仍逐条 str.replace。
+    """
+
+    def __init__(self, rules: Dict[str, str], regex: bool) -> None:
+        self.steps: List[Callable[[str], str]] = []
+        group: List[Tuple[str, str]] = []
+        for pattern, new in rules.items():
+            literal = self._literal(pattern, new, regex)
+            if literal is None:
+                self._close(group)
+                group = []
+                self._add_regex(pattern, new)
+                continue
+            if not pattern:
+                # 空原文会在每个字符之间插入，不能参与合并
+                self._close(group)
+                group = []
+                self.steps.append(lambda text, r=literal: text.replace("", r))
+                continue
+            if any(_overlaps(r, pattern) for _, r in group):
+                self._close(group)
+                group = []
+            group.append((pattern, literal))
+        self._close(group)
+
+    @staticmethod
+    def _literal(pattern: str, new: str, regex: bool) -> Optional[str]:
+        """规则可按普通文本处理时返回替换后的文本，否则返回 None。"""
+        if not regex:
+            if new in STYLE_CODES:
+                code = STYLE_CODES[new]
+                return f"{code}{pattern}{code}"
+            return new
+        if not _is_literal(pattern):
+            return None
+        if new in STYLE_CODES:
+            code = STYLE_CODES[new]
+            return f"{code}{pattern}{code}" if code else new
+        return None if "\\" in new else new
+
+    def _add_regex(self, pattern: str, new: str) -> None:
+        try:
+            compiled = re.compile(pattern)
+        except re.error as err:
+            logging.error(f"❌ 无效的替换正则 {pattern!r}，已忽略: {err}")
+            return
+        if new in STYLE_CODES:
+            code = STYLE_CODES[new]
+
+            def fmt_repl(matched):
+                return f"{code}{matched.group(0)}{code}" if code else new
+
+            self.steps.append(lambda text: compiled.sub(fmt_repl, text))
+        else:
+            self.steps.append(lambda text: compiled.sub(new, text))
+
+    def _close(self, group: List[Tuple[str, str]]) -> None:
+        if len(group) >= AUTOMATON_MIN_KEYWORDS:
+            automaton = KeywordAutomaton([p for p, _ in group])
+            replacements = [r for _, r in group]
+            self.steps.append(lambda text: automaton.replace_all(text, replacements))
+            return
+        for pattern, literal in group:
+            self.steps.append(
+                lambda text, p=pattern, r=literal: text.replace(p, r)
+            )
+
+    def apply(self, text: str) -> str:
+        for step in self.steps:
+            text = step(text)
+        return text
+
+
 def clean_session_files():
     """Delete .session and .session-journal files."""
     for item in os.listdir():
@@ -96,6 +96,16 @@ if check_password(st):
         if uploaded_file is not None:
             with open("image.png", "wb") as f:
                 f.write(uploaded_file.getbuffer())
+        CONFIG.plugins.mark.max_video_size = st.number_input(
+            "Skip videos larger than (MB, 0 means no limit)",
+            min_value=0,
+            value=CONFIG.plugins.mark.max_video_size,
+        )
+        CONFIG.plugins.mark.max_video_duration = st.number_input(
+            "Skip videos longer than (seconds, 0 means no limit)",
+            min_value=0,
+            value=CONFIG.plugins.mark.max_video_duration,
+        )
 
     with st.expander("OCR"):
         st.write("Optical Character Recognition.")
@@ -107,6 +117,16 @@ if check_password(st):
             "Activate OCR for images", value=CONFIG.plugins.ocr.check
         )
         st.write("The text will be added in desciption of image while forwarding.")
+        CONFIG.plugins.ocr.workers = st.number_input(
+            "OCR processes (0 uses one per CPU core)",
+            min_value=0,
+            value=CONFIG.plugins.ocr.workers,
+        )
+        CONFIG.plugins.ocr.timeout = st.number_input(
+            "Give up on an image after (seconds, 0 means never)",
+            min_value=0.0,
+            value=float(CONFIG.plugins.ocr.timeout),
+        )
 
     with st.expander("Replace"):
         CONFIG.plugins.replace.check = st.checkbox(
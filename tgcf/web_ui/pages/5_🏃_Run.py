@@ -37,6 +37,12 @@ if check_password(st):
         CONFIG.show_forwarded_from = st.checkbox(
             "Show 'Forwarded from'", value=CONFIG.show_forwarded_from
         )
+        if not CONFIG.show_forwarded_from:
+            CONFIG.server_copy = st.checkbox(
+                "Copy on Telegram's servers when plugins leave the media unchanged",
+                value=CONFIG.server_copy,
+                help="Forwards without the 'Forwarded from' header instead of re-sending the media.",
+            )
         mode = st.radio("Choose mode", ["live", "past"], index=CONFIG.mode)
         if mode == "past":
             CONFIG.mode = 1
@@ -46,6 +52,26 @@ if check_password(st):
             CONFIG.past.delay = st.slider(
                 "Delay in seconds", 0, 100, value=CONFIG.past.delay
             )
+            CONFIG.past.adaptive = st.checkbox(
+                "Speed up while sends succeed, slow down on flood waits",
+                value=CONFIG.past.adaptive,
+                help="The delay above is then only the starting pace.",
+            )
+            CONFIG.past.parallelism = st.number_input(
+                "Connections to backfill at the same time",
+                min_value=1,
+                value=CONFIG.past.parallelism,
+            )
+            CONFIG.past.workers = st.number_input(
+                "Messages processed by plugins at the same time",
+                min_value=1,
+                value=CONFIG.past.workers,
+            )
+            CONFIG.past.lookahead = st.number_input(
+                "Messages to prepare ahead of sending",
+                min_value=1,
+                value=CONFIG.past.lookahead,
+            )
         else:
             CONFIG.mode = 0
             CONFIG.live.delete_sync = st.checkbox(
@@ -45,6 +45,68 @@ if check_password(st):
             st.write(
                 "When you edit the message in source to something particular, the message will be deleted in both source and destinations."
             )
+
+            CONFIG.live.concurrent_fanout = st.checkbox(
+                "Send to all destinations concurrently",
+                value=CONFIG.live.concurrent_fanout,
+            )
+            if CONFIG.live.concurrent_fanout:
+                CONFIG.live.source_concurrency = st.number_input(
+                    "Max concurrent sends per source",
+                    min_value=1,
+                    value=CONFIG.live.source_concurrency,
+                )
+                CONFIG.live.global_concurrency = st.number_input(
+                    "Max concurrent sends overall",
+                    min_value=1,
+                    value=CONFIG.live.global_concurrency,
+                )
+            CONFIG.dedup.enabled = st.checkbox(
+                "Skip content already sent to a destination",
+                value=CONFIG.dedup.enabled,
+            )
+            if CONFIG.dedup.enabled:
+                CONFIG.dedup.ttl = st.number_input(
+                    "Remember sent content for (seconds)",
+                    min_value=1.0,
+                    value=float(CONFIG.dedup.ttl),
+                )
+                CONFIG.dedup.persist = st.checkbox(
+                    "Keep the duplicate index across restarts",
+                    value=CONFIG.dedup.persist,
+                )
+
+            CONFIG.live.edit_debounce = st.number_input(
+                "Merge edits of the same message within (seconds, 0 disables)",
+                min_value=0.0,
+                value=float(CONFIG.live.edit_debounce),
+            )
+            if CONFIG.live.edit_debounce:
+                CONFIG.live.edit_max_delay = st.number_input(
+                    "Never hold an edit longer than (seconds)",
+                    min_value=0.0,
+                    value=float(CONFIG.live.edit_max_delay),
+                )
+
+            CONFIG.live.dispatch_workers = st.number_input(
+                "Sender workers (0 handles updates inline)",
+                min_value=0,
+                value=CONFIG.live.dispatch_workers,
+            )
+            if CONFIG.live.dispatch_workers:
+                CONFIG.live.dispatch_queue_size = st.number_input(
+                    "Max queued updates",
+                    min_value=1,
+                    value=CONFIG.live.dispatch_queue_size,
+                )
+                orderings = ["none", "source", "pair"]
+                CONFIG.live.ordering = st.selectbox(
+                    "Keep message order per",
+                    orderings,
+                    index=orderings.index(CONFIG.live.ordering),
+                    help="none: no ordering, source: per source chat, pair: per source and destination",
+                )
+
             if st.checkbox("Customize Bot Messages"):
                 st.info(
                     "Note: For userbots, the commands start with `.` instead of `/`, like `.start` and not `/start`"